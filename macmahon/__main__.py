@@ -0,0 +1,124 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# The extractors import each other as flat modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# All extractors starting together get throttled by SAP, cap the requests per host unless configured otherwise
+os.environ.setdefault("SAP_MAX_REQUESTS_PER_HOST", "8")
+
+from entities import ENTITIES
+from extraction import extract_and_send_to_sql
+from sap_client import close_sessions
+from snapshots import subscribe
+from snapshots import close_snapshot
+from utils import dispose_engines
+from streaming import STREAM_TO_SQL
+from metrics import set_job
+import checkpoints
+
+logging.basicConfig(level="INFO", format="%(asctime)s %(threadName)s %(name)s %(levelname)s %(message)s")
+logger = logging.getLogger('MACMAHON')
+
+WORKERS = int(os.getenv("MACMAHON_WORKERS", "4"))
+
+
+def run_attachments(snapshot=None):
+    from work_order_attachments import prepare_recent_attachments_and_send_to_sql
+    return prepare_recent_attachments_and_send_to_sql(snapshot)
+
+
+def get_jobs(names=()):
+    jobs = {name: partial(extract_and_send_to_sql, entity) for name, entity in ENTITIES.items()}
+    # Run together, the attachments take their work orders page by page from the running extraction
+    # instead of waiting for macmahon_work_orders
+    snapshot = subscribe("WORK_ORDER") if "WORK_ORDER" in names and "WORK_ORDER_ATTACHMENTS" in names else None
+    jobs["WORK_ORDER_ATTACHMENTS"] = partial(run_attachments, snapshot)
+    return jobs
+
+
+def get_record_count(result):
+    # Extractors return the loaded DataFrame, or the record count when streaming
+    if isinstance(result, pd.DataFrame):
+        return result.shape[0]
+    return result or 0
+
+
+def run_job(name, job):
+    start = time.time()
+    logger.info("Starting: {}".format(name))
+    try:
+        records = get_record_count(job())
+        outcome = "ok" if records else "empty"
+        error = None
+    except BaseException as e:
+        # The extractors sys.exit(1) on SQL errors, that must only fail this entity
+        records = 0
+        outcome = "failed"
+        error = repr(e)
+        logger.error("{} failed: {}".format(name, error))
+    finally:
+        # Releases subscribers even when the entity failed before its first page
+        close_snapshot(name)
+
+    duration = time.time() - start
+    set_job(name, outcome, records, duration, error)
+    logger.info("Finished: {}, outcome: {}, records: {}, duration: {:.1f}s".format(name, outcome, records, duration))
+    return name, outcome, records, duration, error
+
+
+def run(names, workers=WORKERS):
+    jobs = get_jobs(names)
+    # The attachments wait on the work order snapshot, start them last so a small pool cannot block on them
+    names = sorted(names, key=lambda name: name == "WORK_ORDER_ATTACHMENTS")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extractor") as pool:
+        futures = [pool.submit(run_job, name, jobs[name]) for name in names]
+        results = [future.result() for future in futures]
+
+    close_sessions()
+    dispose_engines()
+    return results
+
+
+def report(results):
+    logger.info("{:<40} {:<8} {:>10} {:>10}".format("entity", "outcome", "records", "seconds"))
+    for name, outcome, records, duration, error in results:
+        logger.info("{:<40} {:<8} {:>10} {:>10.1f}{}".format(name, outcome, records, duration,
+                                                             " " + error if error else ""))
+
+
+def main(argv=None):
+    jobs = get_jobs()
+    parser = argparse.ArgumentParser(prog="python -m macmahon",
+                                     description="Run the SAP extractors with shared SAP and SQL limits")
+    parser.add_argument("entities", nargs="*", metavar="entity", help="entities to run (default all): {}".format(
+        ", ".join(jobs)))
+    parser.add_argument("--workers", type=int, default=WORKERS, help="entities extracted at the same time")
+    parser.add_argument("--resume", action="store_true", default=checkpoints.RESUME,
+                        help="continue from the checkpoints of a run that stopped (RESUME=true)")
+    args = parser.parse_args(argv)
+
+    names = [name.upper() for name in args.entities] or list(jobs)
+    unknown = [name for name in names if name not in jobs]
+    if unknown:
+        parser.error("unknown entities: {}".format(", ".join(unknown)))
+
+    checkpoints.RESUME = args.resume
+    if args.resume and not STREAM_TO_SQL:
+        logger.warning("Only streamed loads (STREAM_TO_SQL=true) and attachments land before the end of a run, "
+                       "the other entities start again")
+
+    results = run(names, args.workers)
+    report(results)
+    return 1 if any(outcome == "failed" for _, outcome, _, _, _ in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import os
+import gzip
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger('ATTACHMENT_STORE')
+
+# Attachment binaries are kept on disk under their SHA-256, the SQL table only holds the reference
+ATTACHMENT_STORE_DIR = os.getenv("ATTACHMENT_STORE_DIR", "attachment_store")
+CHUNK_SIZE = int(os.getenv("ATTACHMENT_CHUNK_SIZE", str(1024 * 1024)))
+# Text like content is gzipped on its way to disk, PDFs, images and the zip based Office Open XML formats
+# are already compressed and stored as they are
+ATTACHMENT_COMPRESSION = os.getenv("ATTACHMENT_COMPRESSION", "true").lower() == "true"
+COMPRESSION_LEVEL = int(os.getenv("ATTACHMENT_COMPRESSION_LEVEL", "6"))
+COMPRESSIBLE_MIME_TYPES = ("text/", "application/xml", "application/json", "application/rtf", "application/msword",
+                           "application/vnd.ms-excel", "application/vnd.ms-powerpoint", "application/vnd.ms-outlook",
+                           "application/postscript", "image/svg+xml", "image/bmp", "image/tiff")
+COMPRESSIBLE_EXTENSIONS = (".txt", ".csv", ".xml", ".json", ".htm", ".html", ".rtf", ".doc", ".xls", ".ppt",
+                           ".msg", ".eml", ".log", ".svg", ".bmp", ".tif", ".tiff", ".dwg", ".dxf")
+COMPRESSED_SUFFIX = ".gz"
+# Maps each SAP document identity to the content it was stored as, it lives with the store it describes
+INDEX_NAME = "index.sqlite"
+
+index = None
+index_lock = threading.Lock()
+
+
+def get_storage_path(content_hash, compressed=False):
+    # Relative to ATTACHMENT_STORE_DIR, fanned out so no directory holds every file
+    return os.path.join(content_hash[:2], content_hash + (COMPRESSED_SUFFIX if compressed else ""))
+
+
+def is_compressible(mime_type=None, file_name=None):
+    if not ATTACHMENT_COMPRESSION:
+        return False
+    if mime_type and mime_type.lower().startswith(COMPRESSIBLE_MIME_TYPES):
+        return True
+    return bool(file_name) and file_name.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def open_temp_file(temp_path, compressed):
+    if compressed:
+        return gzip.open(temp_path, "wb", compresslevel=COMPRESSION_LEVEL)
+    return open(temp_path, "wb")
+
+
+def store_response(response, mime_type=None, file_name=None):
+    # Streams the body to a temporary file chunk by chunk, then moves it to its content address.
+    # Returns (sha256, size in bytes, storage path, stored size in bytes), hash and size are those of the
+    # original content
+    os.makedirs(ATTACHMENT_STORE_DIR, exist_ok=True)
+    temp_path = os.path.join(ATTACHMENT_STORE_DIR, "{}.part".format(uuid.uuid4().hex))
+    compressed = is_compressible(mime_type or response.headers.get("Content-Type"), file_name)
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open_temp_file(temp_path, compressed) as temp_file:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                sha256.update(chunk)
+                size += len(chunk)
+                temp_file.write(chunk)
+        stored_size = os.path.getsize(temp_path)
+
+        content_hash = sha256.hexdigest()
+        storage_path = get_storage_path(content_hash, compressed)
+        target_path = os.path.join(ATTACHMENT_STORE_DIR, storage_path)
+        # Identical content linked to several work orders is stored once
+        if not os.path.exists(target_path):
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.replace(temp_path, target_path)
+    finally:
+        response.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    logger.debug("Stored attachment: {}, size: {}, stored size: {}".format(storage_path, size, stored_size))
+    return content_hash, size, storage_path, stored_size
+
+
+def open_attachment(storage_path):
+    # Readable file object with the original content of a stored attachment
+    path = os.path.join(ATTACHMENT_STORE_DIR, storage_path)
+    if storage_path.endswith(COMPRESSED_SUFFIX):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def get_identity(doc_type, doc_number, doc_part, doc_version, archive_document_id):
+    # A stored document version never changes, so this identifies its content for good
+    return "|".join(str(part) for part in (doc_type, doc_number, doc_part, doc_version, archive_document_id))
+
+
+def get_index():
+    global index
+    if index is None:
+        os.makedirs(ATTACHMENT_STORE_DIR, exist_ok=True)
+        index = sqlite3.connect(os.path.join(ATTACHMENT_STORE_DIR, INDEX_NAME), check_same_thread=False)
+        index.execute("CREATE TABLE IF NOT EXISTS attachments (identity TEXT PRIMARY KEY, content_hash TEXT NOT NULL, "
+                      "content_size INTEGER NOT NULL, storage_path TEXT NOT NULL, stored_size INTEGER)")
+        # Indexes created before compression have no stored size, their files are stored uncompressed
+        if "stored_size" not in [column[1] for column in index.execute("PRAGMA table_info(attachments)")]:
+            index.execute("ALTER TABLE attachments ADD COLUMN stored_size INTEGER")
+            index.execute("UPDATE attachments SET stored_size = content_size")
+        index.execute("CREATE INDEX IF NOT EXISTS attachments_content_hash ON attachments (content_hash)")
+        index.commit()
+    return index
+
+
+def get_stored(identity):
+    # (sha256, size, storage path, stored size) of an already downloaded attachment, None if it has to be fetched
+    with index_lock:
+        row = get_index().execute("SELECT content_hash, content_size, storage_path, stored_size FROM attachments "
+                                  "WHERE identity = ?", (identity,)).fetchone()
+    if row is None or not os.path.exists(os.path.join(ATTACHMENT_STORE_DIR, row[2])):
+        return None
+    return row
+
+
+def set_stored(identity, stored):
+    with index_lock:
+        connection = get_index()
+        connection.execute("INSERT OR REPLACE INTO attachments (identity, content_hash, content_size, storage_path, "
+                           "stored_size) VALUES (?, ?, ?, ?, ?)", (identity,) + tuple(stored))
+        connection.commit()
+
+
+def close_index():
+    global index
+    with index_lock:
+        if index is not None:
+            index.close()
+            index = None
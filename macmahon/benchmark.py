@@ -0,0 +1,196 @@
+import io
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import datetime
+import tracemalloc
+
+# Offline: the column types come from the descriptors only, nothing is fetched from SAP
+os.environ.setdefault("USE_METADATA", "false")
+
+from sqlalchemy import create_engine
+
+from odata import new_page
+from odata import iterate_atom_entries
+from entities import ENTITIES
+from extraction import prepare_records
+from extraction import convert_columns
+from extraction import new_record_batch
+from columnar import get_frame
+from utils import get_sql_frame
+from synthetic_feeds import get_atom_pages
+
+logging.basicConfig(level="WARNING")
+logger = logging.getLogger('BENCHMARK')
+logger.setLevel("INFO")
+
+STAGES = ("parse", "transform", "load")
+
+
+def get_fixture_pages(fixtures, entity_name):
+    # Recorded Atom pages of an entity, <fixtures>/<ENTITY>/*.xml in file name order
+    paths = sorted(glob.glob(os.path.join(fixtures, entity_name, "*.xml")))
+    pages = []
+    for path in paths:
+        with open(path, "rb") as page_file:
+            pages.append(page_file.read())
+    return pages
+
+
+def parse_pages(entity, pages):
+    records = new_record_batch(entity)
+    for page in pages:
+        prepare_records(entity, iterate_atom_entries(io.BytesIO(page), new_page()), records)
+    return records
+
+
+def transform_records(entity, records):
+    data = convert_columns(entity, get_frame(records))
+    data['lastupdatedtime'] = datetime.datetime.now()
+    return data
+
+
+def load_data(entity, data, engine):
+    # The pandas and driver side of the load, into sqlite instead of SQL Server.
+    # Columns a descriptor lists twice are loaded once, sqlite rejects duplicate column names
+    data = data.loc[:, ~data.columns.duplicated()]
+    get_sql_frame(data).to_sql(entity["table"], engine, index=False, if_exists="replace")
+
+
+def run_pipeline(entity, pages, engine=None):
+    # Returns ({stage: seconds}, rows)
+    timings = {}
+    start = time.perf_counter()
+    records = parse_pages(entity, pages)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = transform_records(entity, records)
+    timings["transform"] = time.perf_counter() - start
+    del records
+
+    if engine is not None:
+        start = time.perf_counter()
+        load_data(entity, data, engine)
+        timings["load"] = time.perf_counter() - start
+
+    return timings, data.shape[0]
+
+
+def get_peak_memory(entity, pages, engine=None):
+    # Separate pass, tracemalloc slows everything it traces. Counts Python and numpy allocations,
+    # not libxml2's own buffers
+    tracemalloc.start()
+    try:
+        run_pipeline(entity, pages, engine)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_rates(seconds, rows, size):
+    return {"seconds": round(seconds, 6), "rows_per_second": round(rows / seconds, 1) if seconds else None,
+            "mb_per_second": round(size / 1e6 / seconds, 3) if seconds else None}
+
+
+def benchmark_entity(entity, pages, repeat=3, load=True):
+    engine = create_engine("sqlite://") if load else None
+    size = sum(len(page) for page in pages)
+    best = {}
+    rows = 0
+    # Best of repeat runs, the slower ones measure the machine rather than the code
+    for _ in range(repeat):
+        timings, rows = run_pipeline(entity, pages, engine)
+        for stage, seconds in timings.items():
+            best[stage] = min(seconds, best.get(stage, seconds))
+
+    result = {"rows": rows, "bytes": size, "pages": len(pages)}
+    for stage in STAGES:
+        if stage in best:
+            result[stage] = get_rates(best[stage], rows, size)
+    result["total"] = get_rates(sum(best.values()), rows, size)
+    result["peak_mb"] = round(get_peak_memory(entity, pages, engine) / 1e6, 1)
+    if engine is not None:
+        engine.dispose()
+    return result
+
+
+def get_regressions(results, baseline, tolerance):
+    # (entity, stage, rows/s now, rows/s in the baseline) of every stage slower than the baseline by more than
+    # tolerance, entities or stages missing from either side are not compared
+    regressions = []
+    for name, result in results.items():
+        for stage in STAGES + ("total",):
+            before = baseline.get(name, {}).get(stage, {}).get("rows_per_second")
+            now = result.get(stage, {}).get("rows_per_second")
+            if before and now and now < before * (1 - tolerance):
+                regressions.append((name, stage, now, before))
+    return regressions
+
+
+def report(results):
+    logger.info("{:<36} {:>8} {:>8} {:>12} {:>12} {:>12} {:>12} {:>9} {:>8}".format(
+        "entity", "rows", "MB", "parse r/s", "transform r/s", "load r/s", "total r/s", "total MB/s", "peak MB"))
+    for name, result in results.items():
+        logger.info("{:<36} {:>8} {:>8.1f} {:>12} {:>12} {:>12} {:>12} {:>9} {:>8}".format(
+            name, result["rows"], result["bytes"] / 1e6,
+            *[result.get(stage, {}).get("rows_per_second", "-") for stage in STAGES + ("total",)],
+            result["total"]["mb_per_second"], result["peak_mb"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python benchmark.py",
+                                     description="Parse, transform and load throughput per entity, offline")
+    parser.add_argument("entities", nargs="*", metavar="entity", help="entities to run (default all): {}".format(
+        ", ".join(ENTITIES)))
+    parser.add_argument("--rows", type=int, default=1000, help="entries per synthetic page")
+    parser.add_argument("--pages", type=int, default=5, help="synthetic pages per entity")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per entity, the best one is reported")
+    parser.add_argument("--fixtures", help="directory of recorded Atom pages, <ENTITY>/*.xml, used instead of "
+                                           "synthetic pages for the entities it has")
+    parser.add_argument("--no-load", action="store_true", help="skip the load into sqlite")
+    parser.add_argument("--output", help="write the results as JSON, e.g. to serve as a later baseline")
+    parser.add_argument("--baseline", help="results of an earlier run to compare rows/s against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown against the baseline that fails "
+                                                                     "the run (default 0.2)")
+    args = parser.parse_args(argv)
+
+    names = [name.upper() for name in args.entities] or list(ENTITIES)
+    unknown = [name for name in names if name not in ENTITIES]
+    if unknown:
+        parser.error("unknown entities: {}".format(", ".join(unknown)))
+
+    results = {}
+    for name in names:
+        entity = ENTITIES[name]
+        pages = get_fixture_pages(args.fixtures, name) if args.fixtures else []
+        source = "recorded"
+        if not pages:
+            pages = get_atom_pages(entity, args.rows, args.pages)
+            source = "synthetic"
+        logger.info("Benchmarking {}: {} {} pages, {:.1f} MB".format(name, len(pages), source,
+                                                                     sum(len(page) for page in pages) / 1e6))
+        results[name] = dict(benchmark_entity(entity, pages, args.repeat, not args.no_load), source=source)
+
+    report(results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+        logger.info("Wrote results to: {}".format(args.output))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = get_regressions(results, json.load(baseline_file), args.tolerance)
+        for name, stage, now, before in regressions:
+            logger.error("{} {}: {} rows/s, baseline {} rows/s".format(name, stage, now, before))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
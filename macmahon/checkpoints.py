@@ -0,0 +1,87 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger('CHECKPOINTS')
+
+# Progress of the running extractions (next page link, landed batches, processed keys), so a crashed run
+# can continue with --resume / RESUME=true instead of starting again
+RESUME = os.getenv("RESUME", "false").lower() == "true"
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "macmahon_checkpoints.sqlite")
+
+store = None
+store_lock = threading.Lock()
+
+
+def get_store():
+    global store
+    if store is None:
+        store = sqlite3.connect(CHECKPOINT_DB, check_same_thread=False)
+        store.execute("CREATE TABLE IF NOT EXISTS checkpoints (name TEXT PRIMARY KEY, state TEXT NOT NULL, "
+                      "updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+        store.execute("CREATE TABLE IF NOT EXISTS checkpoint_keys (name TEXT NOT NULL, key TEXT NOT NULL, "
+                      "value TEXT, PRIMARY KEY (name, key))")
+        store.commit()
+    return store
+
+
+def get_checkpoint(name):
+    with store_lock:
+        row = get_store().execute("SELECT state FROM checkpoints WHERE name = ?", (name,)).fetchone()
+    return None if row is None else json.loads(row[0])
+
+
+def set_checkpoint(name, state):
+    with store_lock:
+        connection = get_store()
+        connection.execute("INSERT OR REPLACE INTO checkpoints (name, state, updated_at) "
+                           "VALUES (?, ?, CURRENT_TIMESTAMP)", (name, json.dumps(state)))
+        connection.commit()
+    logger.debug("Checkpoint: {}, state: {}".format(name, state))
+
+
+def get_done_keys(name):
+    # {key: value} of the keys a previous run of name finished
+    with store_lock:
+        rows = get_store().execute("SELECT key, value FROM checkpoint_keys WHERE name = ?", (name,)).fetchall()
+    return {key: json.loads(value) for key, value in rows}
+
+
+def set_key_done(name, key, value=None):
+    with store_lock:
+        connection = get_store()
+        connection.execute("INSERT OR REPLACE INTO checkpoint_keys (name, key, value) VALUES (?, ?, ?)",
+                           (name, key, json.dumps(value)))
+        connection.commit()
+
+
+def clear_checkpoint(name):
+    # Called once the run's data has fully landed, or when a run starts from scratch
+    with store_lock:
+        connection = get_store()
+        connection.execute("DELETE FROM checkpoints WHERE name = ?", (name,))
+        connection.execute("DELETE FROM checkpoint_keys WHERE name = ?", (name,))
+        connection.commit()
+
+
+def get_resume_checkpoint(name):
+    # The checkpoint to continue from, None (and any stale checkpoint dropped) when starting from scratch
+    checkpoint = get_checkpoint(name) if RESUME else None
+    if checkpoint is None:
+        clear_checkpoint(name)
+    else:
+        logger.info("Resuming: {} from checkpoint: {}".format(name, checkpoint))
+    return checkpoint
+
+
+def get_resume_keys(name):
+    # The keys finished by the run to continue, empty (and any stale keys dropped) when starting from scratch
+    if not RESUME:
+        clear_checkpoint(name)
+        return {}
+
+    done = get_done_keys(name)
+    logger.info("Resuming: {}, {} keys already done".format(name, len(done)))
+    return done
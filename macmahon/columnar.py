@@ -0,0 +1,135 @@
+import array
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('COLUMNAR')
+
+# How a batch stores a column
+INT64 = "int64"        # Python ints in an int64 array
+FLOAT64 = "float64"    # floats in a float64 array
+ENCODED = "encoded"    # hashable values (strings, None, NaN) as int32 codes into the distinct values seen
+PLAIN = "plain"        # anything else, one Python object per row
+ARRAY_TYPECODES = {INT64: "q", FLOAT64: "d"}
+
+# An encoded column with more distinct values than this share of its rows (an ID, a free text) costs more
+# in its dictionary than it saves, it is stored plain from then on
+ENCODING_MIN_ROWS = 1000
+ENCODING_MAX_SHARE = 0.5
+
+
+def new_column(kind):
+    if kind in ARRAY_TYPECODES:
+        return {"kind": kind, "values": array.array(ARRAY_TYPECODES[kind])}
+    if kind == ENCODED:
+        return {"kind": kind, "codes": array.array("i"), "index": {}, "distinct": []}
+    return {"kind": PLAIN, "values": []}
+
+
+def new_batch(columns, kinds=None):
+    # Rows appended column by column, kinds (one per column, default PLAIN) decides how each column is stored
+    kinds = kinds or [PLAIN] * len(columns)
+    return {"columns": list(columns), "kinds": list(kinds), "rows": 0,
+            "data": [new_column(kind) for kind in kinds]}
+
+
+def get_values(column, start=0, stop=None):
+    # A list of the column's values from start on
+    if column["kind"] == ENCODED:
+        distinct = column["distinct"]
+        return [distinct[code] for code in column["codes"][start:stop]]
+    if column["kind"] in ARRAY_TYPECODES:
+        return column["values"][start:stop].tolist()
+    return column["values"][start:stop]
+
+
+def make_plain(column, rows):
+    # The first rows of a column, decoded or unpacked into a plain one
+    values = get_values(column, 0, rows)
+    column.clear()
+    column.update(new_column(PLAIN))
+    column["values"].extend(values)
+
+
+def encode_values(column, values):
+    index = column["index"]
+    distinct = column["distinct"]
+    # Only the values new to this page go through Python, the lookups run in C
+    for value in dict.fromkeys(values):
+        if value not in index:
+            index[value] = len(distinct)
+            distinct.append(value)
+    column["codes"].extend(map(index.__getitem__, values))
+
+
+def append_values(column, values, rows):
+    # rows: the batch size before these values
+    try:
+        if column["kind"] == ENCODED:
+            encode_values(column, values)
+            if rows + len(values) >= ENCODING_MIN_ROWS and len(column["distinct"]) > ENCODING_MAX_SHARE * (
+                    rows + len(values)):
+                make_plain(column, rows + len(values))
+        else:
+            column["values"].extend(values)
+    except (TypeError, OverflowError):
+        # An unhashable value, or a number the typed array cannot hold: the column takes any object from now on
+        make_plain(column, rows)
+        column["values"].extend(values)
+
+
+def append_rows(batch, rows):
+    # rows: the row tuples of one page, transposed once here rather than kept until the DataFrame is built
+    if not rows:
+        return
+    for column, values in zip(batch["data"], zip(*rows)):
+        append_values(column, values, batch["rows"])
+    batch["rows"] += len(rows)
+
+
+def get_objects(values):
+    # An object array that never looks inside the values, np.array would turn tuples into rows
+    objects = np.empty(len(values), dtype=object)
+    objects[:] = values
+    return objects
+
+
+def get_column(column):
+    # The whole column as a numpy array, an encoded one by taking its codes from the distinct values
+    if column["kind"] == ENCODED:
+        codes = np.frombuffer(column["codes"], dtype=np.int32) if column["codes"] else np.empty(0, dtype=np.int32)
+        return get_objects(column["distinct"]).take(codes)
+    if column["kind"] in ARRAY_TYPECODES:
+        return np.array(column["values"], dtype=column["kind"])
+    return get_objects(column["values"])
+
+
+def get_rows(batch, start=0):
+    # Row tuples from start on, for consumers that read rows
+    if start >= batch["rows"]:
+        return []
+    return list(zip(*(get_values(column, start) for column in batch["data"])))
+
+
+def clear_batch(batch):
+    batch["data"] = [new_column(kind) for kind in batch["kinds"]]
+    batch["rows"] = 0
+
+
+def truncate_batch(batch, rows):
+    # Drops the rows appended after the first rows, e.g. those of a page that broke off and is read again.
+    # Values only they added stay in an encoded column's dictionary, no code points at them any more
+    for column in batch["data"]:
+        del column["codes" if column["kind"] == ENCODED else "values"][rows:]
+    batch["rows"] = min(batch["rows"], rows)
+
+
+def get_frame(batch):
+    # Decoded columns go straight into the DataFrame, object columns are typed the way pd.DataFrame types rows
+    logger.info("Total records: {}".format(batch["rows"]))
+    data = pd.DataFrame({position: get_column(column) for position, column in enumerate(batch["data"])},
+                        copy=False).infer_objects()
+    data.columns = batch["columns"]
+    logger.info("Prepared DF: {} rows, {} columns".format(data.shape[0], data.shape[1]))
+    return data
@@ -0,0 +1,266 @@
+import os
+
+from extraction import RAW, INT, INT_OR_ZERO, FLOAT, ID, DATE, DATETIMEOFFSET, TIME
+
+# One descriptor per SAP entity, run by extraction.extract_and_send_to_sql.
+#   url / params:  feed and query options of the first request, $select is generated from the columns
+#   table / keys:  target table and the business keys used by upserts
+#   columns:       DataFrame columns in order, each read from the property of the same name
+#   conversions:   column -> conversion, anything not listed is STR
+#   properties:    column -> property, for columns named differently from their property
+#   incremental:   filter on the LastChangeDateTime watermark when INCREMENTAL=true
+#   page_size:     $top used when pages are fetched concurrently
+
+WORK_ORDER = {
+    "name": "WORK_ORDER",
+    "url": os.getenv("WORK_ORDER_URL",
+                     "https://id.api.s4hana.ondemand.com/sap/opu/odata/"
+                     "sap/YY1_WORKORDER_CDS/YY1_WorkOrder"),
+    "params": {},
+    "table": "macmahon_work_orders",
+    "keys": ["ID"],
+    "columns": ["ID", "MaintenanceOrder", "MaintenanceOrderType", "MaintenanceOrderDesc", "MaintPriority",
+                "MaintPriorityType", "Equipment", "WBSElementInternalID", "LastChangeDate", "LastChangeTime",
+                "PlannedStartDate", "PlannedStartTime", "PlannedEndDate", "PlannedEndTime", "ScheduledBasicStartDate",
+                "ScheduledBasicStartTime", "ScheduledBasicEndDate", "ScheduledBasicEndTime", "ActualStartDate",
+                "ActualStartTime", "ConfirmedEndDate", "ConfirmedEndTime", "MaintOrderReferenceDate",
+                "WorkCenterTypeCode", "MainWorkCenter", "MainWorkCenterPlant", "MaintenancePlant",
+                "MaintenancePlannerGroupName", "OrderTypeName", "MaintenanceActivityTypeName",
+                "MaintenancePlannerGroup", "CompanyCode", "IsMarkedForDeletion", "NmbrOfMaintOrdsNotToBeExecuted",
+                "NumberOfCompletedMaintOrders", "CostCenter", "CostCenterName", "Department", "ValidityEndDate",
+                "ValidityStartDate", "LastChangeDateTime", "MaintenanceProcessingPhase", "TechnicalObjectTypeDesc",
+                "MaintenanceActivityType", "CreationDate", "OrderRuntimeDuration", "OrderDurationUnit"],
+    "conversions": {
+        "ID": ID,
+        "MaintPriority": INT_OR_ZERO,
+        "LastChangeDate": DATE,
+        "LastChangeTime": TIME,
+        "PlannedStartDate": DATE,
+        "PlannedStartTime": TIME,
+        "PlannedEndDate": DATE,
+        "PlannedEndTime": TIME,
+        "ScheduledBasicStartDate": DATE,
+        "ScheduledBasicStartTime": TIME,
+        "ScheduledBasicEndDate": DATE,
+        "ScheduledBasicEndTime": TIME,
+        "ActualStartDate": DATE,
+        "ActualStartTime": TIME,
+        "ConfirmedEndDate": DATE,
+        "ConfirmedEndTime": TIME,
+        "MaintOrderReferenceDate": DATE,
+        "NmbrOfMaintOrdsNotToBeExecuted": INT,
+        "NumberOfCompletedMaintOrders": INT,
+        "ValidityEndDate": DATE,
+        "ValidityStartDate": DATE,
+        "LastChangeDateTime": DATETIMEOFFSET,
+        "CreationDate": DATE,
+    },
+    "incremental": True,
+}
+
+MAINTENANCE_ORDER = {
+    "name": "MAINTENANCE_ORDER",
+    "url": os.getenv("MAINTENANCE_ORDER_URL",
+                     "https://id.api.s4hana.ondemand.com/sap/opu/odata/sap/"
+                     "YY1_MOOPERATIONDATA_CDS/YY1_MOOperationData"),
+    "params": {},
+    "table": "macmahon_maintenance_orders",
+    "keys": ["MaintenanceOrder", "MaintOrderOperationCounter"],
+    "columns": ["MaintenanceOrder", "MaintOrderOperationCounter", "MaintOrderRoutingNumber", "FunctionalLocation",
+                "Equipment", "MaintenanceActivityType", "MaintenancePlannerGroup", "MaintenancePlanningPlant",
+                "MaintenanceOrderType", "MaintenancePlant", "MaintObjectLocAcctAssgmtNmbr", "MaintenanceOrderOperation",
+                "OperationPersonResponsible", "OperationControlKey", "OperationDescription", "WorkCenter",
+                "WorkCenterPlant", "OperationPlannedWork", "OperationPlannedWorkUnit", "ConfirmationTotalQuantity",
+                "OperationQuantity", "CreationDate", "LastChangeDateTime", "MaintOrderConfirmation",
+                "MaintOrderOperationInternalID", "SuperiorOperationInternalID", "OperationWorkCenterInternalID",
+                "OperationWorkCenterTypeCode"],
+    "conversions": {
+        "ConfirmationTotalQuantity": RAW,
+        "OperationQuantity": RAW,
+        "CreationDate": DATE,
+        "LastChangeDateTime": DATETIMEOFFSET,
+    },
+    "incremental": True,
+}
+
+MAINTENANCE_NOTIFICATIONS = {
+    "name": "MAINTENANCE_NOTIFICATIONS",
+    "url": os.getenv("MAINTENANCE_NOTIFICATIONS_URL",
+                     "https://id.api.s4hana.ondemand.com/sap/opu/odata/"
+                     "sap/API_MAINTNOTIFICATION/MaintenanceNotification"),
+    "params": {},
+    "table": "macmahon_maintenance_notifications",
+    "keys": ["MaintenanceNotification"],
+    "columns": ["MaintenanceNotification", "MaintNotifInternalID", "NotificationText", "MaintPriority",
+                "NotificationType", "NotifProcessingPhase", "NotifProcessingPhaseDesc", "MaintPriorityDesc",
+                "CreationDate", "LastChangeTime", "LastChangeDate", "LastChangeDateTime", "CreationTime",
+                "ReportedByUser", "ReporterFullName", "PersonResponsible", "MalfunctionEffect", "MalfunctionEffectText",
+                "MalfunctionStartDate", "MalfunctionStartTime", "MalfunctionEndDate", "MalfunctionEndTime",
+                "MaintNotificationCatalog", "MaintNotificationCode", "MaintNotificationCodeGroup", "CatalogProfile",
+                "NotificationCreationDate", "NotificationCreationTime", "NotificationTimeZone", "RequiredStartDate",
+                "RequiredStartTime", "RequiredEndDate", "RequiredEndTime", "LatestAcceptableCompletionDate",
+                "MaintenanceObjectIsDown", "MaintNotificationLongText", "MaintNotifLongTextForEdit", "TechnicalObject",
+                "TechObjIsEquipOrFuncnlLoc", "TechnicalObjectLabel", "MaintenancePlanningPlant",
+                "MaintenancePlannerGroup", "PlantSection", "ABCIndicator", "SuperiorTechnicalObject",
+                "SuperiorTechnicalObjectName", "SuperiorObjIsEquipOrFuncnlLoc", "SuperiorTechnicalObjectLabel",
+                "ManufacturerPartTypeName", "TechObjIsEquipOrFuncnlLocDesc", "FunctionalLocation",
+                "TechnicalObjectDescription", "AssetLocation", "LocationName", "BusinessArea", "CompanyCode",
+                "TechnicalObjectCategory", "TechnicalObjectType", "MainWorkCenterPlant", "MainWorkCenter", "PlantName",
+                "MaintenancePlannerGroupName", "MaintenancePlant", "LocationDescription", "MainWorkCenterText",
+                "MainWorkCenterPlantName", "MaintenancePlantName", "PlantSectionPersonRespName", "ABCIndicatorDesc",
+                "PersonResponsibleName", "MaintenanceOrder", "MaintenanceOrderType", "ConcatenatedActiveSystStsName",
+                "MaintenanceActivityType", "MaintObjDowntimeDurationUnit", "MaintObjectDowntimeDuration",
+                "MaintenancePlan", "MaintenanceItem", "TaskListGroup", "TaskListGroupCounter",
+                "MaintenancePlanCallNumber", "MaintenanceTaskListType", "NotificationReferenceDate",
+                "NotificationReferenceTime", "NotificationCompletionDate", "CompletionTime", "AssetRoom",
+                "MaintNotifExtReferenceNumber", "MaintNotifRejectionReasonCode", "MaintNotifRejectionRsnCodeTxt",
+                "MaintNotifDetectionCodeText", "MaintNotifDetectionCodeGrpTxt", "MaintNotifProcessPhaseCode",
+                "MaintNotifProcessSubPhaseCode", "EAMProcessPhaseCodeDesc", "EAMProcessSubPhaseCodeDesc"],
+    "conversions": {
+        "CreationDate": DATE,
+        "LastChangeTime": TIME,
+        "LastChangeDate": DATE,
+        "LastChangeDateTime": DATETIMEOFFSET,
+        "CreationTime": TIME,
+        "MalfunctionStartDate": DATE,
+        "MalfunctionStartTime": TIME,
+        "MalfunctionEndDate": DATE,
+        "MalfunctionEndTime": TIME,
+        "NotificationCreationDate": DATE,
+        "NotificationCreationTime": TIME,
+        "RequiredStartDate": DATE,
+        "RequiredStartTime": TIME,
+        "RequiredEndDate": DATE,
+        "RequiredEndTime": TIME,
+        "LatestAcceptableCompletionDate": DATE,
+        "NotificationReferenceDate": DATE,
+        "NotificationReferenceTime": TIME,
+        "NotificationCompletionDate": DATE,
+        "CompletionTime": TIME,
+    },
+    "incremental": True,
+    "page_size": 100,
+}
+
+PURCHASE_ORDER = {
+    "name": "PURCHASE_ORDER",
+    "url": os.getenv("PURCHASE_ORDER_URL",
+                     "https://id.api.s4hana.ondemand.com/sap/opu/odata/sap/"
+                     "API_PURCHASEORDER_PROCESS_SRV/A_PurOrdAccountAssignment"),
+    "params": {},
+    "table": "macmahon_purchase_orders",
+    "keys": ["PurchaseOrder", "PurchaseOrderItem", "AccountAssignmentNumber"],
+    "columns": ["PurchaseOrder", "PurchaseOrderItem", "AccountAssignmentNumber", "IsDeleted",
+                "PurchaseOrderQuantityUnit", "Quantity", "MultipleAcctAssgmtDistrPercent", "DocumentCurrency",
+                "PurgDocNetAmount", "GLAccount", "SalesOrderItem", "SalesOrderScheduleLine", "OrderID", "ProfitCenter",
+                "WBSElementInternalID", "WBSElement", "WBSElementExternalID", "FunctionalArea",
+                "SettlementReferenceDate"],
+    "conversions": {
+        "PurchaseOrder": RAW,
+        "PurgDocNetAmount": RAW,
+        "GLAccount": RAW,
+        "SalesOrderItem": RAW,
+        "SettlementReferenceDate": DATE,
+    },
+}
+
+PURCHASE_ORDER_TEXT = {
+    "name": "PURCHASE_ORDER_TEXT",
+    "url": os.getenv("PURCHASE_ORDER_TEXT_URL",
+                     "https://id.api.s4hana.ondemand.com/sap/opu/odata/sap/"
+                     "API_PURCHASEORDER_PROCESS_SRV/A_PurchaseOrderItem"),
+    "params": {},
+    "table": "macmahon_purchase_order_item_text",
+    "keys": ["PurchaseOrder", "PurchaseOrderItem"],
+    "columns": ["PurchaseOrder", "PurchaseOrderItem", "PurchasingDocumentDeletionCode", "PurchaseOrderItemText",
+                "Plant", "StorageLocation", "MaterialGroup", "PurchasingInfoRecord", "SupplierMaterialNumber",
+                "OrderQuantity", "PurchaseOrderQuantityUnit", "OrderPriceUnit", "OrderPriceUnitToOrderUnitNmrtr",
+                "OrdPriceUnitToOrderUnitDnmntr", "DocumentCurrency", "NetPriceAmount", "NetPriceQuantity", "TaxCode",
+                "TaxDeterminationDate", "TaxCountry", "PriceIsToBePrinted", "OverdelivTolrtdLmtRatioInPct",
+                "UnlimitedOverdeliveryIsAllowed", "UnderdelivTolrtdLmtRatioInPct", "ValuationType",
+                "IsCompletelyDelivered", "IsFinallyInvoiced", "PurchaseOrderItemCategory", "AccountAssignmentCategory",
+                "MultipleAcctAssgmtDistribution", "PartialInvoiceDistribution", "GoodsReceiptIsExpected",
+                "GoodsReceiptIsNonValuated", "InvoiceIsExpected", "InvoiceIsGoodsReceiptBased", "PurchaseContract",
+                "PurchaseContractItem", "Customer", "Subcontractor", "SupplierIsSubcontractor", "ItemNetWeight",
+                "ItemWeightUnit", "TaxJurisdiction", "PricingDateControl", "ItemVolume", "ItemVolumeUnit",
+                "SupplierConfirmationControlKey", "IncotermsClassification", "IncotermsTransferLocation",
+                "EvaldRcptSettlmtIsAllowed", "PurchaseRequisition", "PurchaseRequisitionItem", "IsReturnsItem",
+                "ServicePackage", "EarmarkedFunds", "EarmarkedFundsDocument", "EarmarkedFundsItem",
+                "EarmarkedFundsDocumentItem", "IncotermsLocation1", "IncotermsLocation2", "Material",
+                "InternationalArticleNumber", "ManufacturerMaterial", "ServicePerformer", "ProductType",
+                "ExpectedOverallLimitAmount", "OverallLimitAmount", "PurContractForOverallLimit",
+                "ReferenceDeliveryAddressID", "DeliveryAddressID", "DeliveryAddressName", "DeliveryAddressName2",
+                "DeliveryAddressFullName", "DeliveryAddressStreetName", "DeliveryAddressHouseNumber",
+                "DeliveryAddressCityName", "DeliveryAddressPostalCode", "DeliveryAddressRegion",
+                "DeliveryAddressCountry", "DownPaymentType", "DownPaymentPercentageOfTotAmt", "DownPaymentAmount",
+                "DownPaymentDueDate", "BR_MaterialUsage", "BR_MaterialOrigin", "BR_CFOPCategory",
+                "BR_IsProducedInHouse", "ConsumptionTaxCtrlCode", "PurgProdCmplncSupplierStatus",
+                "PurgProductMarketabilityStatus", "PurgSafetyDataSheetStatus", "PurgProdCmplncDngrsGoodsStatus"],
+    "conversions": {
+        "TaxDeterminationDate": DATE,
+        "ItemVolume": FLOAT,
+        "ExpectedOverallLimitAmount": FLOAT,
+        "OverallLimitAmount": FLOAT,
+        "DownPaymentPercentageOfTotAmt": FLOAT,
+        "DownPaymentAmount": FLOAT,
+        "DownPaymentDueDate": DATE,
+    },
+}
+
+DOCUMENT_HEADER = {
+    "name": "DOCUMENT_HEADER",
+    "url": os.getenv("DOCUMENT_HEADER_URL", "https://id.api.s4hana.ondemand.com/sap/opu/"
+                                            "odata/sap/API_RESERVATION_DOCUMENT_SRV/"
+                                            "A_ReservationDocumentHeader"),
+    "params": {},
+    "table": "macmahon_document_headers",
+    "keys": ["Reservation"],
+    "columns": ["Reservation", "OrderID", "GoodsMovementType", "CostCenter", "GoodsRecipientName", "ReservationDate",
+                "IsCheckedAgainstFactoryCal", "Customer", "WBSElement", "ControllingArea", "SalesOrder",
+                "SalesOrderItem", "SalesOrderScheduleLine", "AssetNumber", "AssetSubNumber",
+                "NetworkNumberForAcctAssgmt", "IssuingOrReceivingPlant", "IssuingOrReceivingStorageLoc"],
+    "conversions": {
+        "ReservationDate": DATE,
+    },
+}
+
+PRODUCT_DESCRIPTION = {
+    "name": "PRODUCT_DESCRIPTION",
+    "url": os.getenv("PRODUCT_DESCRIPTION_URL", "https://id.api.s4hana.ondemand.com/sap/opu/"
+                                                "odata/sap/API_PRODUCT_SRV/A_ProductDescription"),
+    "params": {},
+    "table": "macmahon_product_description",
+    "keys": ["Product", "Language"],
+    "columns": ["Product", "Language", "ProductDescription"],
+}
+
+RESERVATION_DOCUMENT = {
+    "name": "RESERVATION_DOCUMENT",
+    "url": os.getenv("RESERVATION_DOCUMENT_URL", "https://id.api.s4hana.ondemand.com/sap/opu/"
+                                                 "odata/sap/API_RESERVATION_DOCUMENT_SRV/"
+                                                 "A_ReservationDocumentItem"),
+    "params": {},
+    "table": "macmahon_reservation_document",
+    "keys": ["Reservation", "ReservationItem"],
+    "columns": ["Reservation", "ReservationItem", "RecordType", "Product", "RequirementType", "MatlCompRequirementDate",
+                "Plant", "ManufacturingOrderOperation", "GoodsMovementIsAllowed", "StorageLocation", "Batch",
+                "DebitCreditCode", "BaseUnit", "GLAccount", "ResvnAccountIsEnteredManually", "GoodsMovementType",
+                "EntryUnit", "CompanyCodeCurrency", "IssuingOrReceivingPlant", "IssuingOrReceivingStorageLoc",
+                "PurchasingDocument", "PurchasingDocumentItem", "Supplier", "ResvnItmRequiredQtyInBaseUnit",
+                "ReservationItemIsFinallyIssued", "ReservationItmIsMarkedForDeltn", "ResvnItmRequiredQtyInBaseUnit",
+                "ResvnItmRequiredQtyInEntryUnit", "ResvnItmRequiredQtyInBaseUnit", "ResvnItmWithdrawnQtyInBaseUnit",
+                "ResvnItmWithdrawnAmtInCCCrcy", "GoodsRecipientName", " UnloadingPointName", "ReservationItemText"],
+    "conversions": {
+        "MatlCompRequirementDate": DATE,
+    },
+    "properties": {" UnloadingPointName": "UnloadingPointName"},
+}
+
+# Same feed as the notifications, loaded into its own table with its own watermark
+MAINTENANCE_NOTIFICATIONS_LONG_TEXT = dict(MAINTENANCE_NOTIFICATIONS, name="MAINTENANCE_NOTIFICATIONS_LONG_TEXT",
+                                           params={}, table="macmahon_maintenance_notifications_long_text")
+
+ENTITIES = {entity["name"]: entity for entity in (WORK_ORDER, MAINTENANCE_ORDER, MAINTENANCE_NOTIFICATIONS,
+                                                  MAINTENANCE_NOTIFICATIONS_LONG_TEXT, PURCHASE_ORDER,
+                                                  PURCHASE_ORDER_TEXT, DOCUMENT_HEADER, PRODUCT_DESCRIPTION,
+                                                  RESERVATION_DOCUMENT)}
@@ -0,0 +1,423 @@
+import os
+import time
+import logging
+import decimal
+import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.dialects.mssql import BIGINT
+from sqlalchemy.dialects.mssql import BIT
+from sqlalchemy.dialects.mssql import DATETIME2
+from sqlalchemy.dialects.mssql import DECIMAL
+from sqlalchemy.dialects.mssql import FLOAT as FLOAT_TYPE
+from sqlalchemy.dialects.mssql import INTEGER
+from sqlalchemy.dialects.mssql import NVARCHAR
+from sqlalchemy.dialects.mssql import REAL
+from sqlalchemy.dialects.mssql import SMALLINT
+from sqlalchemy.dialects.mssql import TIME as TIME_TYPE
+from sqlalchemy.dialects.mssql import TINYINT
+
+from utils import send_df_to_sql
+from utils import LOAD_MODE
+from sap_client import sap_get
+from sap_client import get_body_sample
+from odata import iterate_entity_pages
+from odata import FEED_HEADERS
+from odata import DEFAULT_PAGE_SIZE
+from odata import new_progress
+from odata import complete_page
+from odata import READ_ERRORS
+from streaming import STREAM_TO_SQL
+from streaming import stream_pages_to_sql
+from watermarks import INCREMENTAL
+from watermarks import get_incremental_params
+from watermarks import update_watermark
+from metadata import get_entity_properties
+from snapshots import publish
+from snapshots import close_snapshot
+from checkpoints import get_resume_checkpoint
+from metrics import count
+from metrics import timer
+from metrics import add_time
+from columnar import new_batch
+from columnar import append_rows
+from columnar import clear_batch
+from columnar import truncate_batch
+from columnar import get_frame
+from columnar import INT64
+from columnar import FLOAT64
+from columnar import ENCODED
+from columnar import PLAIN
+
+logger = logging.getLogger('EXTRACTION')
+
+# Column conversions used by the entity descriptors
+STR = "str"                    # str(value), a m:null property becomes 'None'
+NULLABLE = "nullable"          # str(value), a m:null property becomes NaN
+RAW = "raw"                    # value as parsed, m:null stays None
+INT = "int"
+INT_OR_ZERO = "int_or_zero"    # int(value), an empty or m:null property becomes 0
+FLOAT = "float"
+ID = "id"                      # str(value) without the 3 character prefix of CDS view IDs
+# Converted a whole column at a time once the page is in a DataFrame
+DATE = "date"                  # Edm.DateTime -> datetime64, stored as DATETIME2
+DATETIMEOFFSET = "datetimeoffset"  # Edm.DateTimeOffset -> UTC datetime64, stored as DATETIME2 in UTC
+TIME = "time"                  # Edm.Time (PT10H30M00S) -> timedelta64, stored as TIME
+
+CONVERSIONS = {
+    STR: "str(record[{0}])",
+    NULLABLE: "(nan if record[{0}] is None else str(record[{0}]))",
+    RAW: "record[{0}]",
+    INT: "int(record[{0}])",
+    INT_OR_ZERO: "(int(record[{0}]) if record[{0}] else 0)",
+    FLOAT: "float(record[{0}])",
+    ID: "str(record[{0}])[3:]",
+    DATE: "record[{0}]",
+    DATETIMEOFFSET: "record[{0}]",
+    TIME: "record[{0}]",
+}
+
+SQL_TYPES = {
+    DATE: DATETIME2,
+    DATETIMEOFFSET: DATETIME2,
+    TIME: TIME_TYPE,
+}
+
+# How the record batches store each conversion's values, the rest are strings/None/NaN and dictionary encoded.
+# RAW values of a JSON feed can be anything
+COLUMN_KINDS = {
+    INT: INT64,
+    INT_OR_ZERO: INT64,
+    FLOAT: FLOAT64,
+    RAW: PLAIN,
+}
+
+# Conversions that leave the value untyped, $metadata decides their pandas and SQL types
+UNTYPED = (STR, NULLABLE, RAW)
+
+# Edm types of the service $metadata, Edm.String and Edm.Decimal also take their MaxLength/Precision/Scale
+EDM_SQL_TYPES = {
+    "Edm.Boolean": BIT,
+    "Edm.Byte": TINYINT,
+    "Edm.SByte": SMALLINT,
+    "Edm.Int16": SMALLINT,
+    "Edm.Int32": INTEGER,
+    "Edm.Int64": BIGINT,
+    "Edm.Double": FLOAT_TYPE,
+    "Edm.Single": REAL,
+}
+EDM_NUMERIC = ("Edm.Decimal", "Edm.Byte", "Edm.SByte", "Edm.Int16", "Edm.Int32", "Edm.Int64", "Edm.Double",
+               "Edm.Single")
+# Edm.Decimal without Precision/Scale facets, SQL Server's own default DECIMAL(18, 0) would drop the fraction
+DECIMAL_DEFAULT_PRECISION = 38
+DECIMAL_DEFAULT_SCALE = 10
+# Atom sends Edm.Boolean as 'true'/'false', odata.get_json_record writes JSON booleans the same way
+BOOLEANS = {"true": True, "false": False}
+NVARCHAR_MAX_LENGTH = 4000
+
+# pandas 2 infers one format from the first value unless told the column is ISO 8601
+ISO_FORMAT = {"format": "ISO8601"} if int(pd.__version__.split(".")[0]) >= 2 else {}
+JSON_DATE_PATTERN = r"^/Date\((-?\d+)"
+DURATION_PATTERN = r"^PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?$"
+
+# ODATA_AUTO_SELECT=false requests every property again instead of only those the columns read
+AUTO_SELECT = os.getenv("ODATA_AUTO_SELECT", "true").lower() == "true"
+
+row_extractors = {}
+column_types = {}
+
+
+def get_column_types(entity):
+    # {column: $metadata facets} of the entity columns, empty when $metadata could not be read
+    types = column_types.get(entity["name"])
+    if types is None:
+        entity_properties = get_entity_properties(entity["url"])
+        properties = entity.get("properties", {})
+        types = {column: entity_properties[properties.get(column, column)] for column in entity["columns"]
+                 if properties.get(column, column) in entity_properties}
+        column_types[entity["name"]] = types
+
+    return types
+
+
+def get_select(entity):
+    # Each property the columns read, once and in column order
+    properties = entity.get("properties", {})
+    selected = []
+    for column in entity["columns"]:
+        if properties.get(column, column) not in selected:
+            selected.append(properties.get(column, column))
+
+    # SAP rejects the whole request for an unknown property in $select
+    entity_properties = get_entity_properties(entity["url"])
+    if entity_properties:
+        missing = [prop for prop in selected if prop not in entity_properties]
+        if missing:
+            logger.warning("{} properties not in the service $metadata, left out of $select: {}".format(
+                entity["name"], ", ".join(missing)))
+            selected = [prop for prop in selected if prop in entity_properties]
+
+    return ",".join(selected)
+
+
+def get_order_by(entity):
+    # The key properties, a stable order for $top/$skip pages
+    properties = entity.get("properties", {})
+    return ",".join(properties.get(key, key) for key in entity.get("keys") or [])
+
+
+def get_conversion(entity, column):
+    conversion = entity.get("conversions", {}).get(column, STR)
+    # A typed string column stores m:null as NULL instead of 'None', which would not fit NVARCHAR(1)
+    if conversion == STR and get_column_types(entity).get(column, {}).get("type") == "Edm.String":
+        return NULLABLE
+
+    return conversion
+
+
+def compile_row_extractor(entity):
+    # Generates a single function returning the whole row tuple, a record then costs one call
+    # instead of one Python statement and null check per field
+    properties = entity.get("properties", {})
+    fields = [CONVERSIONS[get_conversion(entity, column)].format(repr(properties.get(column, column)))
+              for column in entity["columns"]]
+
+    source = "def extract_row(record):\n    return ({},)\n".format(", ".join(fields))
+    namespace = {"nan": np.nan}
+    exec(compile(source, "<{} row extractor>".format(entity["name"]), "exec"), namespace)
+    return namespace["extract_row"]
+
+
+def get_row_extractor(entity):
+    extract_row = row_extractors.get(entity["name"])
+    if extract_row is None:
+        extract_row = compile_row_extractor(entity)
+        row_extractors[entity["name"]] = extract_row
+
+    return extract_row
+
+
+def new_record_batch(entity):
+    # The columnar batch prepare_records appends the entity's rows to
+    return new_batch(entity["columns"], [COLUMN_KINDS.get(get_conversion(entity, column), ENCODED)
+                                         for column in entity["columns"]])
+
+
+def to_datetimes(values, utc=False):
+    values = values.where(values.notnull(), None).astype(object)
+    result = pd.to_datetime(values.where(~values.str.startswith("/Date(", na=False)), errors="coerce", utc=utc,
+                            **ISO_FORMAT)
+
+    # Raw /Date(ms)/ values, ticks are UTC whatever offset follows them
+    json_dates = values.str.extract(JSON_DATE_PATTERN, expand=False).dropna()
+    if len(json_dates):
+        result[json_dates.index] = pd.to_datetime(json_dates.astype("int64"), unit="ms", utc=utc)
+
+    return result
+
+
+def to_durations(values):
+    parts = values.where(values.notnull(), None).astype(object).str.extract(DURATION_PATTERN).astype(float)
+    seconds = parts[0].fillna(0) * 3600 + parts[1].fillna(0) * 60 + parts[2].fillna(0)
+    return pd.to_timedelta(seconds, unit="s").where(parts.notnull().any(axis=1))
+
+
+def to_decimal(value):
+    # Atom and JSON both send Edm.Decimal as a string, an empty or malformed one is NULL as with to_numeric
+    if isinstance(value, str):
+        try:
+            number = decimal.Decimal(value)
+        except decimal.InvalidOperation:
+            return None
+        return number if number.is_finite() else None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return decimal.Decimal(value)
+    if isinstance(value, float) and np.isfinite(value):
+        return decimal.Decimal(repr(value))
+    return None
+
+
+def to_decimals(values):
+    # Exact amounts and quantities, float64 would round them past 15-16 significant digits
+    return values.map(to_decimal).astype(object)
+
+
+def convert_columns(entity, data):
+    # One vectorized pass per column over the whole page/batch instead of a conversion per row
+    for column, conversion in entity.get("conversions", {}).items():
+        if conversion == DATE:
+            data[column] = to_datetimes(data[column])
+        elif conversion == DATETIMEOFFSET:
+            data[column] = to_datetimes(data[column], utc=True)
+        elif conversion == TIME:
+            data[column] = to_durations(data[column])
+
+    for column, facets in get_column_types(entity).items():
+        if get_conversion(entity, column) not in UNTYPED:
+            continue
+        # Some descriptors list a column more than once, data[column] is then a DataFrame
+        if facets["type"] == "Edm.Decimal":
+            data[column] = data[[column]].apply(to_decimals)
+        elif facets["type"] in EDM_NUMERIC:
+            data[column] = data[[column]].apply(pd.to_numeric, errors="coerce")
+        elif facets["type"] == "Edm.Boolean":
+            data[column] = data[[column]].apply(lambda values: values.map(BOOLEANS))
+
+    return data
+
+
+def get_metadata_sql_type(facets):
+    edm_type = facets["type"]
+    if edm_type == "Edm.String":
+        max_length = facets["max_length"]
+        if max_length and max_length.isdigit() and int(max_length) <= NVARCHAR_MAX_LENGTH:
+            return NVARCHAR(int(max_length))
+        return NVARCHAR(None)
+
+    if edm_type == "Edm.Decimal" and facets["precision"]:
+        return DECIMAL(int(facets["precision"]), int(facets["scale"] or 0))
+    if edm_type == "Edm.Decimal":
+        return DECIMAL(DECIMAL_DEFAULT_PRECISION, DECIMAL_DEFAULT_SCALE)
+
+    return EDM_SQL_TYPES.get(edm_type)
+
+
+def get_sql_types(entity):
+    sql_types = {"lastupdatedtime": DATETIME2}
+    for column, facets in get_column_types(entity).items():
+        conversion = get_conversion(entity, column)
+        # INT/FLOAT columns already hold numbers, they only take a numeric $metadata type
+        if conversion in UNTYPED or conversion == ID or facets["type"] in EDM_NUMERIC:
+            sql_type = get_metadata_sql_type(facets)
+            if sql_type is not None:
+                sql_types[column] = sql_type
+
+    for column, conversion in entity.get("conversions", {}).items():
+        if conversion in SQL_TYPES:
+            sql_types[column] = SQL_TYPES[conversion]
+
+    return sql_types
+
+
+def get_page_getter(entity, params):
+    def get_page(next_link=None):
+        # The next link SAP returns already carries the query options of the first request
+        url = next_link or entity["url"]
+        # Until the headers are in, the body is read and timed as it is parsed
+        with timer(entity["name"], "fetch"):
+            response = sap_get(url, params=None if next_link else params, stream=True, headers=FEED_HEADERS)
+        response.raw.decode_content = True
+        count(entity["name"], "requests")
+
+        if response.status_code != 200:
+            logger.error("Received status code: {}, Content {}".format(response.status_code,
+                                                                       get_body_sample(response)))
+            return None
+
+        return response
+
+    return get_page
+
+
+def prepare_records(entity, entries, records):
+    # records: new_record_batch(entity), the page's row tuples only live until they are appended by column
+    extract_row = get_row_extractor(entity)
+    rows = []
+    errors = 0
+    # Only a record that cannot be extracted is skipped, a page that cannot be read fails as a whole.
+    # entries may still be decoding the page (timed as parse by odata), only the row extraction is timed here
+    seconds = 0.0
+    for record in entries:
+        start = time.perf_counter()
+        try:
+            rows.append(extract_row(record))
+        except Exception as e:
+            errors += 1
+            logger.error("Could not extract {} record: {}, message: {}".format(entity["name"], record.get("__id"), e))
+        seconds += time.perf_counter() - start
+
+    start = time.perf_counter()
+    append_rows(records, rows)
+    add_time(entity["name"], "extract", seconds + time.perf_counter() - start)
+
+    count(entity["name"], "rows", len(rows))
+    if errors:
+        count(entity["name"], "row_errors", errors)
+
+
+def iterate_record_pages(entity, records, progress=None):
+    # Yields the record batch after every parsed page, the new rows also go to the entity's snapshot subscribers.
+    # progress (odata.new_progress) tracks where a resumed run would continue
+    progress = progress if progress is not None else new_progress()
+    try:
+        params = dict(entity["params"])
+        if AUTO_SELECT and "$select" not in params:
+            params["$select"] = get_select(entity)
+        if entity.get("incremental"):
+            params.update(get_incremental_params(entity["name"]))
+
+        get_page = get_page_getter(entity, params)
+
+        def consume(entries):
+            # The page is streamed into the batch, a body that breaks off is read again from its first entry.
+            # Returns the batch's rows before the page
+            start = records["rows"]
+            try:
+                prepare_records(entity, entries, records)
+            except READ_ERRORS:
+                truncate_batch(records, start)
+                raise
+            return start
+
+        for start in iterate_entity_pages(get_page, entity["url"], params, entity=entity["name"],
+                                      page_size=entity.get("page_size", DEFAULT_PAGE_SIZE), progress=progress,
+                                      order_by=get_order_by(entity), consume=consume):
+            count(entity["name"], "pages")
+            complete_page(progress)
+            publish(entity["name"], records, start)
+            yield records
+    finally:
+        close_snapshot(entity["name"])
+
+
+def extract_to_pd(entity):
+    records = new_record_batch(entity)
+    for _ in iterate_record_pages(entity, records):
+        pass
+
+    logger.info("Total number of {} records: {}, columns: {}".format(entity["name"], records["rows"],
+                                                                    len(entity["columns"])))
+    if records["rows"] == 0:
+        return None
+
+    with timer(entity["name"], "transform"):
+        df = get_frame(records)
+        clear_batch(records)
+        df = convert_columns(entity, df)
+        df['lastupdatedtime'] = datetime.datetime.now()
+    return df
+
+
+def extract_and_send_to_sql(entity):
+    incremental = entity.get("incremental", False)
+    mode = "upsert" if INCREMENTAL and incremental else LOAD_MODE
+    if STREAM_TO_SQL:
+        # Batches that already landed in the load table are not fetched again by a resumed run
+        records = new_record_batch(entity)
+        checkpoint = get_resume_checkpoint(entity["name"])
+        progress = new_progress(checkpoint)
+        return stream_pages_to_sql(iterate_record_pages(entity, records, progress), entity["table"], mode,
+                                   entity["keys"], watermark_entity=entity["name"] if incremental else None,
+                                   convert=lambda data: convert_columns(entity, data), dtype=get_sql_types(entity),
+                                   progress=progress, entity_name=entity["name"], checkpoint=checkpoint)
+
+    data = extract_to_pd(entity)
+    if isinstance(data, pd.DataFrame):
+        logger.info("Sending {} records to SQL table: {}".format(data.shape[0], entity["table"]))
+        with timer(entity["name"], "write"):
+            send_df_to_sql(data, entity["table"], mode=mode, keys=entity["keys"], dtype=get_sql_types(entity))
+        if incremental:
+            update_watermark(entity["name"], data)
+
+    return data
@@ -0,0 +1,100 @@
+import os
+import re
+import time
+import logging
+import tempfile
+import threading
+
+from lxml import etree
+
+from sap_client import sap_get
+
+logger = logging.getLogger('METADATA')
+
+# Service $metadata documents are kept on disk and refetched once older than METADATA_MAX_AGE_HOURS
+USE_METADATA = os.getenv("USE_METADATA", "true").lower() == "true"
+METADATA_CACHE_DIR = os.getenv("METADATA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "macmahon_metadata"))
+METADATA_MAX_AGE = float(os.getenv("METADATA_MAX_AGE_HOURS", "24")) * 3600
+
+services = {}
+services_lock = threading.Lock()
+
+
+def get_service_root(url):
+    return url.rstrip("/").rsplit("/", 1)[0]
+
+
+def get_entity_set_name(url):
+    return url.rstrip("/").rsplit("/", 1)[1].split("?")[0]
+
+
+def get_cache_path(service_root):
+    return os.path.join(METADATA_CACHE_DIR, "{}.xml".format(re.sub("[^A-Za-z0-9]+", "_", service_root)))
+
+
+def fetch_metadata(service_root):
+    cache_path = get_cache_path(service_root)
+    if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < METADATA_MAX_AGE:
+        with open(cache_path, "rb") as cache_file:
+            return cache_file.read()
+
+    response = sap_get(service_root + "/$metadata", headers={"Accept": "application/xml"})
+    if response.status_code != 200:
+        logger.error("Could not fetch $metadata of: {}, status code: {}".format(service_root, response.status_code))
+        # A stale copy still beats no types at all
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as cache_file:
+                return cache_file.read()
+        return None
+
+    os.makedirs(METADATA_CACHE_DIR, exist_ok=True)
+    with open(cache_path, "wb") as cache_file:
+        cache_file.write(response.content)
+    logger.info("Cached $metadata of: {} in: {}".format(service_root, cache_path))
+    return response.content
+
+
+def parse_metadata(document):
+    # Returns {entity set: {property: {"type", "max_length", "precision", "scale"}}}
+    root = etree.fromstring(document)
+    entity_types = {}
+    for schema in root.iter("{*}Schema"):
+        for entity_type in schema.iter("{*}EntityType"):
+            properties = {}
+            for prop in entity_type.iter("{*}Property"):
+                properties[prop.get("Name")] = {
+                    "type": prop.get("Type"),
+                    "max_length": prop.get("MaxLength"),
+                    "precision": prop.get("Precision"),
+                    "scale": prop.get("Scale"),
+                }
+            entity_types["{}.{}".format(schema.get("Namespace"), entity_type.get("Name"))] = properties
+
+    entity_sets = {}
+    for entity_set in root.iter("{*}EntitySet"):
+        entity_sets[entity_set.get("Name")] = entity_types.get(entity_set.get("EntityType"), {})
+
+    return entity_sets
+
+
+def get_service_metadata(service_root):
+    with services_lock:
+        if service_root not in services:
+            entity_sets = {}
+            try:
+                document = fetch_metadata(service_root)
+                if document is not None:
+                    entity_sets = parse_metadata(document)
+            except Exception as e:
+                logger.error("Could not read $metadata of: {}, message: {}".format(service_root, e))
+            services[service_root] = entity_sets
+
+    return services[service_root]
+
+
+def get_entity_properties(url):
+    # {property: type facets} of the entity set behind a feed URL, empty when $metadata is unavailable
+    if not USE_METADATA:
+        return {}
+
+    return get_service_metadata(get_service_root(url)).get(get_entity_set_name(url), {})
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import atexit
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger('METRICS')
+
+# Both files are written when the process exits, leave a path empty to skip that export
+METRICS_JSON = os.getenv("METRICS_JSON", "")
+# e.g. /var/lib/node_exporter/textfile_collector/macmahon.prom for the node_exporter textfile collector
+METRICS_PROM = os.getenv("METRICS_PROM", "")
+
+# Work that runs outside an entity (e.g. $metadata, token fetches) is reported under this name
+OTHER = "other"
+
+started = time.time()
+# (entity, stage): [seconds, calls]
+stages = {}
+# (entity, counter): value, e.g. rows, bytes, pages, retries
+counters = {}
+# entity: {"outcome", "records", "duration", "error"} of the orchestrator jobs
+jobs = {}
+metrics_lock = threading.Lock()
+# Entity whose stage the current thread is running, so shared code like the SAP retries can be attributed
+current = threading.local()
+
+
+def get_current_entity():
+    return getattr(current, "entity", None)
+
+
+def add_time(entity, stage, seconds):
+    with metrics_lock:
+        totals = stages.setdefault((entity or OTHER, stage), [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+
+def count(entity, name, value=1):
+    with metrics_lock:
+        key = (entity or OTHER, name)
+        counters[key] = counters.get(key, 0) + value
+
+
+@contextmanager
+def timer(entity, stage):
+    previous = get_current_entity()
+    current.entity = entity
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(entity, stage, time.perf_counter() - start)
+        current.entity = previous
+
+
+def set_job(entity, outcome, records, duration, error=None):
+    with metrics_lock:
+        jobs[entity] = {"outcome": outcome, "records": records, "duration": duration, "error": error}
+
+
+def get_summary():
+    with metrics_lock:
+        entities = {}
+        for (entity, stage), (seconds, calls) in stages.items():
+            summary = entities.setdefault(entity, {"stages": {}, "counters": {}})
+            summary["stages"][stage] = {"seconds": round(seconds, 6), "calls": calls}
+        for (entity, name), value in counters.items():
+            entities.setdefault(entity, {"stages": {}, "counters": {}})["counters"][name] = value
+        for entity, job in jobs.items():
+            entities.setdefault(entity, {"stages": {}, "counters": {}})["job"] = dict(job)
+
+    finished = time.time()
+    return {
+        "started": datetime.datetime.fromtimestamp(started, datetime.timezone.utc).isoformat(),
+        "finished": datetime.datetime.fromtimestamp(finished, datetime.timezone.utc).isoformat(),
+        "duration": round(finished - started, 3),
+        "entities": entities,
+    }
+
+
+def get_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def get_prometheus_text(summary):
+    # Every value describes this run only, so they are exported as gauges
+    samples = {}
+    help_texts = {}
+
+    def add(name, help_text, labels, value):
+        help_texts[name] = help_text
+        label_text = ",".join("{}=\"{}\"".format(label, get_label(v)) for label, v in labels)
+        samples.setdefault(name, []).append("{}{{{}}} {}".format(name, label_text, value) if labels else
+                                            "{} {}".format(name, value))
+
+    add("macmahon_run_start_timestamp_seconds", "Start of the run", (), round(started, 3))
+    add("macmahon_run_duration_seconds", "Duration of the run", (), summary["duration"])
+    for entity, entity_summary in sorted(summary["entities"].items()):
+        for stage, totals in sorted(entity_summary["stages"].items()):
+            labels = (("entity", entity), ("stage", stage))
+            add("macmahon_stage_seconds", "Time spent per entity and stage", labels, totals["seconds"])
+            add("macmahon_stage_calls", "Times an entity went through a stage", labels, totals["calls"])
+        for name, value in sorted(entity_summary["counters"].items()):
+            add("macmahon_{}".format(name), "{} per entity".format(name.replace("_", " ").capitalize()),
+                (("entity", entity),), value)
+        job = entity_summary.get("job")
+        if job is not None:
+            labels = (("entity", entity),)
+            add("macmahon_job_records", "Records loaded by the job", labels, job["records"])
+            add("macmahon_job_duration_seconds", "Duration of the job", labels, round(job["duration"], 3))
+            add("macmahon_job_failed", "1 if the job failed", labels, int(job["outcome"] == "failed"))
+
+    lines = []
+    for name, name_samples in samples.items():
+        lines += ["# HELP {} {}".format(name, help_texts[name]), "# TYPE {} gauge".format(name)] + name_samples
+    return "\n".join(lines) + "\n"
+
+
+def write_file(path, text):
+    # Written aside and moved in place, so a collector never reads half a file
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "w") as temp_file:
+        temp_file.write(text)
+    os.replace(temp_path, path)
+
+
+def write_metrics(json_path=None, prom_path=None):
+    json_path = json_path if json_path is not None else METRICS_JSON
+    prom_path = prom_path if prom_path is not None else METRICS_PROM
+    if not json_path and not prom_path:
+        return
+
+    summary = get_summary()
+    try:
+        if json_path:
+            write_file(json_path, json.dumps(summary, indent=2, sort_keys=True))
+            logger.info("Wrote run summary to: {}".format(json_path))
+        if prom_path:
+            write_file(prom_path, get_prometheus_text(summary))
+            logger.info("Wrote Prometheus metrics to: {}".format(prom_path))
+    except Exception as e:
+        logger.error("Could not write the run metrics, message: {}".format(e))
+
+
+# The single scripts and the orchestrator both end with sys.exit, the exports are written either way
+atexit.register(write_metrics)
@@ -0,0 +1,466 @@
+import os
+import re
+import sys
+import gzip
+import time
+import uuid
+import random
+import signal
+import hashlib
+import logging
+import argparse
+import datetime
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode, quote, unquote
+from xml.sax.saxutils import escape
+
+from entities import ENTITIES
+from metadata import get_service_root
+from metadata import get_entity_set_name
+from odata import BOUNDARY_PATTERN
+from odata import BLANK_LINE
+from synthetic_feeds import get_rows
+from synthetic_feeds import get_atom_page
+from synthetic_feeds import get_json_page
+from synthetic_feeds import get_metadata_document
+from synthetic_feeds import get_feed_properties
+from synthetic_feeds import WORDS
+
+logging.basicConfig(level="INFO", format="%(asctime)s %(threadName)s %(name)s %(levelname)s %(message)s")
+logger = logging.getLogger('MOCK_SAP')
+
+# Local OData v2 stand-in for the S/4HANA services the extractors read, every option can also be set here
+MOCK_SAP_PORT = int(os.getenv("MOCK_SAP_PORT", "8080"))
+MOCK_SAP_ROWS = int(os.getenv("MOCK_SAP_ROWS", "10000"))
+MOCK_SAP_PAGE_SIZE = int(os.getenv("MOCK_SAP_PAGE_SIZE", "1000"))
+MOCK_SAP_LATENCY = float(os.getenv("MOCK_SAP_LATENCY", "0"))
+MOCK_SAP_THROTTLE_RATE = float(os.getenv("MOCK_SAP_THROTTLE_RATE", "0"))
+MOCK_SAP_ERROR_RATE = float(os.getenv("MOCK_SAP_ERROR_RATE", "0"))
+MOCK_SAP_TRUNCATE_RATE = float(os.getenv("MOCK_SAP_TRUNCATE_RATE", "0"))
+MOCK_SAP_RETRY_AFTER = int(os.getenv("MOCK_SAP_RETRY_AFTER", "1"))
+MOCK_SAP_ATTACHMENTS = int(os.getenv("MOCK_SAP_ATTACHMENTS", "2"))
+MOCK_SAP_ATTACHMENT_SIZE = int(os.getenv("MOCK_SAP_ATTACHMENT_SIZE", str(64 * 1024)))
+# Rendered pages kept for the next run over the same data, the widest entities take ~3 MB a page
+MOCK_SAP_CACHED_PAGES = int(os.getenv("MOCK_SAP_CACHED_PAGES", "128"))
+
+ATTACHMENT_SERVICE = "/sap/opu/odata/sap/API_CV_ATTACHMENT_SRV"
+ATTACHMENT_MIME_TYPES = (("application/pdf", "pdf"), ("text/plain", "txt"), ("image/jpeg", "jpg"),
+                         ("application/msword", "doc"))
+SESSION_COOKIE = "SAP_SESSIONID_MCK_100"
+CSRF_TOKEN = uuid.uuid4().hex
+
+FILTER_CONDITION = re.compile(r"^\s*(\w+)\s+(eq|ne|gt|ge|lt|le)\s+(?:(datetimeoffset|datetime)?'((?:[^']|'')*)'|"
+                              r"(-?\d+(?:\.\d+)?))\s*$")
+KEY_PREDICATE = re.compile(r"(\w+)='((?:[^']|'')*)'")
+COMPARISONS = {
+    "eq": lambda a, b: a == b,
+    "ne": lambda a, b: a != b,
+    "gt": lambda a, b: a > b,
+    "ge": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "le": lambda a, b: a <= b,
+}
+
+# {service path: {entity set: entity}}, the path of each descriptor URL whatever host it names
+services = {}
+for entity in ENTITIES.values():
+    services.setdefault(get_service_root(urlsplit(entity["url"]).path), {}).setdefault(
+        get_entity_set_name(entity["url"]), entity)
+
+settings = {}
+stats = {"requests": 0, "throttled": 0, "errors": 0, "truncated": 0, "bytes": 0}
+stats_lock = threading.Lock()
+
+
+def add_stat(name, value=1):
+    with stats_lock:
+        stats[name] += value
+
+
+def get_error(status, code, message):
+    body = ('<?xml version="1.0" encoding="utf-8"?><error xmlns="http://schemas.microsoft.com/ado/2007/08/'
+            'dataservices/metadata"><code>{}</code><message xml:lang="en">{}</message></error>'
+            .format(escape(code), escape(message)))
+    return status, {"Content-Type": "application/xml"}, body.encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def get_entity_rows(entity_set_path):
+    service, entity_set = entity_set_path.rsplit("/", 1)
+    entity = services[service][entity_set]
+    logger.info("Generating {} rows of: {}".format(settings["rows"], entity_set))
+    return get_rows(entity, settings["rows"])
+
+
+def get_comparable(value, literal_type):
+    # Dates compare as naive UTC, numbers as numbers, anything else as text
+    if literal_type in ("datetimeoffset", "datetime"):
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return parsed
+    return value
+
+
+def parse_filter(text):
+    # [(property, operator, literal type, literal)] of "<property> <op> <literal> and ...", the form the
+    # incremental extraction sends, anything richer is rejected as SAP would reject an unknown function
+    conditions = []
+    for part in re.split(r"\s+and\s+", text):
+        match = FILTER_CONDITION.match(part)
+        if match is None:
+            raise ValueError("Unsupported $filter expression: {}".format(part))
+        prop, operator, literal_type, text_literal, number = match.groups()
+        if number is not None:
+            conditions.append((prop, operator, "number", float(number)))
+        else:
+            literal = text_literal.replace("''", "'")
+            conditions.append((prop, operator, literal_type, get_comparable(literal, literal_type)))
+    return conditions
+
+
+def matches(row, conditions):
+    for prop, operator, literal_type, literal in conditions:
+        value = row.get(prop)
+        if value is None:
+            if operator != "ne":
+                return False
+            continue
+        try:
+            value = float(value) if literal_type == "number" else get_comparable(value, literal_type)
+        except ValueError:
+            return False
+        if not COMPARISONS[operator](value, literal):
+            return False
+    return True
+
+
+@lru_cache(maxsize=32)
+def get_filtered_rows(entity_set_path, filter_text):
+    rows = get_entity_rows(entity_set_path)
+    if not filter_text:
+        return rows
+    conditions = parse_filter(filter_text)
+    return [row for row in rows if matches(row, conditions)]
+
+
+@lru_cache(maxsize=MOCK_SAP_CACHED_PAGES)
+def get_page_body(entity_set_path, filter_text, select, skip, count, next_link, json_format, base_url):
+    service, entity_set = entity_set_path.rsplit("/", 1)
+    entity = services[service][entity_set]
+    rows = get_filtered_rows(entity_set_path, filter_text)[skip:skip + count]
+    if select:
+        selected = select.split(",")
+        rows = [{prop: row[prop] for prop in selected} for row in rows]
+    if json_format:
+        return get_json_page(entity, rows, next_link, base_url, skip)
+    return get_atom_page(entity, rows, next_link, base_url, skip)
+
+
+@lru_cache(maxsize=MOCK_SAP_CACHED_PAGES)
+def get_compressed(body):
+    return gzip.compress(body, compresslevel=6)
+
+
+def get_feed(service, entity_set, params, json_format, base_url):
+    entity = services[service][entity_set]
+    select = params.get("$select", "")
+    if select:
+        known = dict(get_feed_properties(entity))
+        unknown = [prop for prop in select.split(",") if prop not in known]
+        if unknown:
+            return get_error(400, "/IWBEP/CM_MGW_RT/022", "Property {} not found in type {}Type".format(
+                unknown[0], entity_set))
+
+    try:
+        rows = get_filtered_rows("{}/{}".format(service, entity_set), params.get("$filter", ""))
+    except ValueError as e:
+        return get_error(400, "/IWBEP/CM_MGW_RT/004", str(e))
+
+    skip = int(params.get("$skiptoken") or params.get("$skip") or 0)
+    next_link = None
+    # Client driven paging ($top/$skip) gets the page it asked for, but like the gateway never more than
+    # one server driven page, the rest of a larger $top is behind a next link
+    end = min(skip + int(params["$top"]), len(rows)) if "$top" in params else len(rows)
+    count = max(0, min(settings["page_size"], end - skip))
+    if skip + count < end:
+        # Like the gateway, the next link repeats the query options of the request
+        next_params = [(name, value) for name, value in params.items() if name != "$skiptoken"]
+        next_params.append(("$skiptoken", str(skip + count)))
+        next_link = "{}?{}".format(entity_set, urlencode(next_params, safe="$,'():", quote_via=quote))
+
+    body = get_page_body("{}/{}".format(service, entity_set), params.get("$filter", ""), select, skip, count,
+                         next_link, json_format, base_url)
+    content_type = "application/json" if json_format else "application/atom+xml;type=feed"
+    return 200, {"Content-Type": content_type}, body
+
+
+def get_count(service, entity_set, params):
+    try:
+        rows = get_filtered_rows("{}/{}".format(service, entity_set), params.get("$filter", ""))
+    except ValueError as e:
+        return get_error(400, "/IWBEP/CM_MGW_RT/004", str(e))
+    return 200, {"Content-Type": "text/plain"}, str(len(rows)).encode()
+
+
+def get_attachment_keys(work_order, number):
+    digest = hashlib.md5("{}-{}".format(work_order, number).encode()).hexdigest().upper()
+    mime_type, extension = ATTACHMENT_MIME_TYPES[number % len(ATTACHMENT_MIME_TYPES)]
+    return {
+        "DocumentInfoRecordDocType": "DRW",
+        "DocumentInfoRecordDocNumber": digest[:25],
+        "DocumentInfoRecordDocPart": "000",
+        "DocumentInfoRecordDocVersion": "00",
+        "LogicalDocument": digest[:32],
+        "ArchiveDocumentID": digest[-32:],
+        "LinkedSAPObjectKey": work_order,
+        "BusinessObjectTypeName": "PMAUFK",
+        "FileName": "{}_{}.{}".format(work_order, number, extension),
+        "MimeType": mime_type,
+    }
+
+
+def get_listing(params, base_url):
+    # GetAllOriginals: media link entries with their properties outside atom:content
+    work_order = params.get("LinkedSAPObjectKey", "").strip("'")
+    parts = ['<?xml version="1.0" encoding="utf-8"?><feed xml:base="{}" xmlns="http://www.w3.org/2005/Atom" '
+             'xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata" '
+             'xmlns:d="http://schemas.microsoft.com/ado/2007/08/dataservices"><id>{}GetAllOriginals</id>'
+             '<title type="text">GetAllOriginals</title>'.format(base_url, base_url)]
+    for number in range(settings["attachments"]):
+        keys = get_attachment_keys(work_order, number)
+        key = ",".join("{}='{}'".format(name, keys[name]) for name in list(keys)[:8])
+        parts.append('<entry><id>{0}AttachmentContentSet({1})</id><title type="text">AttachmentContentSet</title>'
+                     '<content type="{2}" src="{0}AttachmentContentSet({1})/$value"/><m:properties>'
+                     .format(base_url, escape(key), keys["MimeType"]))
+        parts += ["<d:{0}>{1}</d:{0}>".format(name, escape(value)) for name, value in keys.items()]
+        parts.append("</m:properties></entry>")
+    parts.append("</feed>")
+    return 200, {"Content-Type": "application/atom+xml;type=feed"}, "".join(parts).encode("utf-8")
+
+
+@lru_cache(maxsize=256)
+def get_attachment_content(key, mime_type):
+    rng = random.Random(key)
+    size = settings["attachment_size"]
+    if mime_type.startswith("text/") or mime_type == "application/msword":
+        return " ".join(rng.choice(WORDS) for _ in range(size // 5 + 1)).encode()[:size]
+    # Already compressed formats look like noise
+    return rng.getrandbits(8 * size).to_bytes(size, "little")
+
+
+def get_attachment(path):
+    # Only the documents GetAllOriginals lists for the work order exist
+    keys = dict(KEY_PREDICATE.findall(unquote(path)))
+    work_order = keys.get("LinkedSAPObjectKey", "")
+    for number in range(settings["attachments"]):
+        attachment_keys = get_attachment_keys(work_order, number)
+        if attachment_keys["LogicalDocument"] == keys.get("LogicalDocument"):
+            mime_type = attachment_keys["MimeType"]
+            return 200, {"Content-Type": mime_type}, get_attachment_content(keys["LogicalDocument"], mime_type)
+
+    return get_error(404, "/IWBEP/CM_MGW_RT/020", "Resource not found for segment 'AttachmentContent'")
+
+
+def get_response(path, query, accept, base_host):
+    # (status, headers, body) of a GET, shared by plain requests and $batch parts
+    params = dict(parse_qsl(query, keep_blank_values=True))
+    json_format = params.get("$format") == "json" or "json" in accept
+    path = path.rstrip("/")
+
+    if path.startswith(ATTACHMENT_SERVICE + "/"):
+        resource = path[len(ATTACHMENT_SERVICE) + 1:]
+        if resource == "$metadata":
+            return 200, {"Content-Type": "application/xml"}, get_metadata_document("API_CV_ATTACHMENT_SRV", [])
+        if resource == "GetAllOriginals":
+            return get_listing(params, "{}{}/".format(base_host, ATTACHMENT_SERVICE))
+        if resource.startswith("AttachmentContentSet(") and resource.endswith("/$value"):
+            return get_attachment(resource)
+        return get_error(404, "/IWBEP/CM_MGW_RT/020", "Resource not found for segment '{}'".format(resource))
+
+    if path.endswith("/$metadata") and path[:-len("/$metadata")] in services:
+        service = path[:-len("/$metadata")]
+        return 200, {"Content-Type": "application/xml"}, get_metadata_document(
+            service.rsplit("/", 1)[1], list(services[service].values()))
+
+    counting = path.endswith("/$count")
+    if counting:
+        path = path[:-len("/$count")]
+    service, _, entity_set = path.rpartition("/")
+    if entity_set not in services.get(service, {}):
+        return get_error(404, "/IWBEP/CM_MGW_RT/021", "Resource not found for segment '{}'".format(entity_set))
+
+    if counting:
+        return get_count(service, entity_set, params)
+    return get_feed(service, entity_set, params, json_format, "{}{}/".format(base_host, service))
+
+
+def parse_batch_request(body, content_type):
+    # [(path, headers)] of the GETs in a $batch body, paths relative to the service root
+    boundary = BOUNDARY_PATTERN.search(content_type).group(1).encode()
+    requests = []
+    for part in body.split(b"--" + boundary)[1:]:
+        if part.startswith(b"--"):
+            break
+        _, message = BLANK_LINE.split(part.lstrip(b"\r\n"), 1)
+        lines = message.decode("utf-8").strip().splitlines()
+        _, path, _ = lines[0].split(" ", 2)
+        headers = dict(line.split(":", 1) for line in lines[1:] if ":" in line)
+        requests.append((path, {name.strip().lower(): value.strip() for name, value in headers.items()}))
+    return requests
+
+
+def get_batch_response(service, body, content_type, base_host):
+    boundary = "batch_{}".format(uuid.uuid4().hex)
+    parts = []
+    for path, headers in parse_batch_request(body, content_type):
+        split = urlsplit(path)
+        status, part_headers, part_body = get_response("{}/{}".format(service, split.path), split.query,
+                                                       headers.get("accept", ""), base_host)
+        head = ["HTTP/1.1 {} {}".format(status, "OK" if status == 200 else "Error")]
+        head += ["{}: {}".format(name, value) for name, value in part_headers.items()]
+        head.append("Content-Length: {}".format(len(part_body)))
+        parts.append(b"--" + boundary.encode() + b"\r\nContent-Type: application/http\r\n"
+                     b"Content-Transfer-Encoding: binary\r\n\r\n" + "\r\n".join(head).encode() + b"\r\n\r\n" +
+                     part_body + b"\r\n")
+    parts.append(b"--" + boundary.encode() + b"--\r\n")
+    return 202, {"Content-Type": "multipart/mixed; boundary={}".format(boundary)}, b"".join(parts)
+
+
+class MockSapHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def handle(self):
+        # Clients drop idle keep-alive connections whenever they like, that is no server error
+        try:
+            super().handle()
+        except ConnectionError:
+            pass
+
+    def log_message(self, format, *args):
+        logger.debug("{} {}".format(self.address_string(), format % args))
+
+    def get_base_host(self):
+        return "http://{}".format(self.headers.get("Host", "localhost:{}".format(settings["port"])))
+
+    def inject_faults(self):
+        # True when the request was answered with an injected 429/503
+        if settings["latency"]:
+            time.sleep(random.uniform(0.5, 1.5) * settings["latency"])
+        if random.random() < settings["throttle_rate"]:
+            add_stat("throttled")
+            self.send(*get_error(429, "TOO_MANY_REQUESTS", "Rate limit exceeded"),
+                      extra_headers={"Retry-After": str(settings["retry_after"])})
+            return True
+        if random.random() < settings["error_rate"]:
+            add_stat("errors")
+            self.send(*get_error(503, "SERVICE_UNAVAILABLE", "Injected error"))
+            return True
+        return False
+
+    def send(self, status, headers, body, extra_headers=None):
+        if "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 1024 and status == 200:
+            body = get_compressed(body)
+            headers = dict(headers, **{"Content-Encoding": "gzip"})
+
+        self.send_response(status)
+        for name, value in dict(headers, **(extra_headers or {})).items():
+            self.send_header(name, value)
+        if SESSION_COOKIE not in self.headers.get("Cookie", ""):
+            self.send_header("Set-Cookie", "{}={}; path=/".format(SESSION_COOKIE, uuid.uuid4().hex))
+        if self.headers.get("X-CSRF-Token", "").lower() == "fetch":
+            self.send_header("X-CSRF-Token", CSRF_TOKEN)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        add_stat("requests")
+        if status == 200 and len(body) > 1024 and random.random() < settings["truncate_rate"]:
+            # Body breaks off half way, the client sees a dropped connection mid page
+            add_stat("truncated")
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+        add_stat("bytes", len(body))
+
+    def do_GET(self):
+        if self.inject_faults():
+            return
+        split = urlsplit(self.path)
+        self.send(*get_response(split.path, split.query, self.headers.get("Accept", ""), self.get_base_host()))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        split = urlsplit(self.path)
+        if not split.path.endswith("/$batch"):
+            self.send(*get_error(405, "METHOD_NOT_ALLOWED", "Only $batch accepts POST"))
+            return
+        if self.headers.get("X-CSRF-Token") != CSRF_TOKEN:
+            self.send(*get_error(403, "CSRF_TOKEN", "CSRF token validation failed"),
+                      extra_headers={"X-CSRF-Token": "Required"})
+            return
+        if self.inject_faults():
+            return
+        self.send(*get_batch_response(split.path[:-len("/$batch")], body, self.headers.get("Content-Type", ""),
+                                      self.get_base_host()))
+
+
+def get_environment(base_host):
+    # The variables that point the extractors at this server
+    environment = {}
+    for name, entity in ENTITIES.items():
+        url = base_host + urlsplit(entity["url"]).path
+        # The long text entity reads the notifications feed
+        if url not in environment.values():
+            environment["{}_URL".format(name)] = url
+    environment["ATTACHMENT_SERVICE_URL"] = base_host + ATTACHMENT_SERVICE
+    environment["ATTACHMENT_CONTENT_URL"] = base_host + ATTACHMENT_SERVICE
+    return environment
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python mock_sap.py",
+                                     description="Local mock of the SAP OData services, for load tests")
+    parser.add_argument("--port", type=int, default=MOCK_SAP_PORT)
+    parser.add_argument("--rows", type=int, default=MOCK_SAP_ROWS, help="rows per entity set")
+    parser.add_argument("--page-size", type=int, default=MOCK_SAP_PAGE_SIZE, help="rows per server driven page")
+    parser.add_argument("--latency", type=float, default=MOCK_SAP_LATENCY,
+                        help="seconds added to every request, +/- 50%%")
+    parser.add_argument("--throttle-rate", type=float, default=MOCK_SAP_THROTTLE_RATE,
+                        help="share of requests answered 429 with Retry-After")
+    parser.add_argument("--retry-after", type=int, default=MOCK_SAP_RETRY_AFTER, help="Retry-After seconds of a 429")
+    parser.add_argument("--error-rate", type=float, default=MOCK_SAP_ERROR_RATE,
+                        help="share of requests answered 503")
+    parser.add_argument("--truncate-rate", type=float, default=MOCK_SAP_TRUNCATE_RATE,
+                        help="share of responses whose body breaks off half way")
+    parser.add_argument("--attachments", type=int, default=MOCK_SAP_ATTACHMENTS, help="attachments per work order")
+    parser.add_argument("--attachment-size", type=int, default=MOCK_SAP_ATTACHMENT_SIZE, help="bytes per attachment")
+    args = parser.parse_args(argv)
+    settings.update(vars(args))
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockSapHandler)
+    server.daemon_threads = True
+    # Stopped with kill as well as Ctrl-C, both log the stats
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    base_host = "http://127.0.0.1:{}".format(args.port)
+    logger.info("Serving {} entity sets of {} rows on: {}, point the extractors at it with:".format(
+        sum(len(entity_sets) for entity_sets in services.values()), args.rows, base_host))
+    for variable, url in get_environment(base_host).items():
+        logger.info("export {}={}".format(variable, url))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info("Served {requests} responses, {bytes} bytes, {throttled} throttled, {errors} errors, "
+                    "{truncated} truncated".format(**stats))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
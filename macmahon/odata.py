@@ -0,0 +1,476 @@
+import io
+import os
+import re
+import time
+import uuid
+import logging
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlencode, quote
+
+import orjson
+from lxml import etree
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import HTTPError
+
+from sap_client import sap_get
+from sap_client import sap_post
+from sap_client import get_backoff
+from sap_client import RETRIES
+from sap_client import get_body_sample
+from metrics import count
+from metrics import add_time
+
+logger = logging.getLogger('ODATA')
+
+# "xml" (Atom, default) or "json", both produce the same {property: value} records
+ODATA_FORMAT = os.getenv("ODATA_FORMAT", "xml").lower()
+FEED_HEADERS = {"Accept": "application/json" if ODATA_FORMAT == "json" else "application/atom+xml"}
+
+# Pages fetched in parallel per entity, override a single entity with <ENTITY>_CONCURRENCY
+DEFAULT_CONCURRENCY = int(os.getenv("ODATA_CONCURRENCY", "1"))
+DEFAULT_PAGE_SIZE = int(os.getenv("ODATA_PAGE_SIZE", "1000"))
+# How an entity's pages were requested, a resumed run has to continue the same way
+LINK_PAGING = "link"    # one after another, following the next links
+SKIP_PAGING = "skip"    # $top/$skip pages of a $count plan
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+METADATA_NS = "http://schemas.microsoft.com/ado/2007/08/dataservices/metadata"
+DATA_NS = "http://schemas.microsoft.com/ado/2007/08/dataservices"
+
+FEED_TAG = "{%s}feed" % ATOM_NS
+ENTRY_TAG = "{%s}entry" % ATOM_NS
+LINK_TAG = "{%s}link" % ATOM_NS
+ID_TAG = "{%s}id" % ATOM_NS
+CONTENT_PROPERTIES_PATH = "{%s}content/{%s}properties" % (ATOM_NS, METADATA_NS)
+PROPERTIES_TAG = "{%s}properties" % METADATA_NS
+NULL_ATTRIBUTE = "{%s}null" % METADATA_NS
+XML_BASE_ATTRIBUTE = "{http://www.w3.org/XML/1998/namespace}base"
+DATA_TAG_PREFIX_LENGTH = len(DATA_NS) + 2
+
+BOUNDARY_PATTERN = re.compile(r'boundary="?([^";]+)"?')
+BLANK_LINE = re.compile(rb"\r?\n\r?\n")
+# A page body that breaks off while it is read: truncated XML/JSON, dropped connection, read timeout
+READ_ERRORS = (etree.XMLSyntaxError, orjson.JSONDecodeError, HTTPError, OSError)
+
+JSON_DATE = re.compile(r"^/Date\((-?\d+)([+-]\d{4})?\)/$")
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def get_entry_record(entry):
+    properties = entry.find(CONTENT_PROPERTIES_PATH)
+    if properties is None:
+        # Media link entries (e.g. attachment originals) carry m:properties outside atom:content
+        properties = entry.find(PROPERTIES_TAG)
+
+    record = {"__id": entry.findtext(ID_TAG)}
+    for prop in properties:
+        if prop.get(NULL_ATTRIBUTE) == "true":
+            record[prop.tag[DATA_TAG_PREFIX_LENGTH:]] = None
+        else:
+            record[prop.tag[DATA_TAG_PREFIX_LENGTH:]] = prop.text or ''
+
+    return record
+
+
+def new_page(position=0):
+    # position: pages of the entity up to and including this one, what a resumed run skips
+    return {"next_link": None, "entries": 0, "complete": False, "position": position}
+
+
+def new_progress(checkpoint=None):
+    # Shared with the caller: "page" is the page being read, "next_link"/"pages" where a resumed run continues,
+    # "paging" (and "page_size" of the $skip plan) how the pages were requested
+    checkpoint = checkpoint or {}
+    return {"page": None, "next_link": checkpoint.get("next_link"), "pages": checkpoint.get("pages", 0),
+            "paging": checkpoint.get("paging"), "page_size": checkpoint.get("page_size")}
+
+
+def complete_page(progress):
+    # Called once the caller has consumed the current page
+    page = progress["page"]
+    if page is not None and page["complete"]:
+        progress["next_link"] = page["next_link"]
+        progress["pages"] = page["position"]
+
+
+def iterate_atom_entries(source, page):
+    # Yields one {property: value} dict per atom:entry, m:null properties come out as None.
+    # Each entry is freed once extracted so memory is bounded by a single entry, not the page.
+    context = etree.iterparse(source, events=("end",), tag=(ENTRY_TAG, LINK_TAG), huge_tree=True)
+    for _, elem in context:
+        parent = elem.getparent()
+        if elem.tag == ENTRY_TAG:
+            record = get_entry_record(elem)
+            page["entries"] += 1
+            elem.clear()
+            while elem.getprevious() is not None:
+                del parent[0]
+            yield record
+        elif parent is not None and parent.tag == FEED_TAG and elem.get("rel") == "next":
+            # SAP returns the next link relative to the feed's xml:base
+            page["next_link"] = urljoin(parent.get(XML_BASE_ATTRIBUTE, ''), elem.get("href"))
+
+    page["complete"] = True
+
+
+def get_json_date(value):
+    match = JSON_DATE.match(value)
+    if match is None:
+        return value
+
+    # Render /Date(ms)/ and /Date(ms+offset)/ the way the Atom feed writes Edm.DateTime/DateTimeOffset
+    milliseconds, offset = match.groups()
+    dt = EPOCH + datetime.timedelta(milliseconds=int(milliseconds))
+    if offset is not None:
+        # OData v2 JSON offsets are in minutes, the ticks themselves are UTC
+        minutes = int(offset)
+        dt = dt + datetime.timedelta(minutes=minutes)
+
+    text = dt.strftime("%Y-%m-%dT%H:%M:%S")
+    if dt.microsecond:
+        text += ".{:03d}".format(dt.microsecond // 1000)
+    if offset is not None:
+        text += "Z" if minutes == 0 else "{}{:02d}:{:02d}".format("-" if minutes < 0 else "+",
+                                                                   abs(minutes) // 60, abs(minutes) % 60)
+    return text
+
+
+def get_json_record(result):
+    metadata = result.get("__metadata", {})
+    record = {"__id": metadata.get("id", metadata.get("uri"))}
+    for name, value in result.items():
+        if isinstance(value, str):
+            record[name] = get_json_date(value) if value.startswith("/Date(") else value
+        elif value is None:
+            record[name] = None
+        elif isinstance(value, bool):
+            record[name] = "true" if value else "false"
+        elif isinstance(value, (int, float)):
+            record[name] = str(value)
+        # __metadata and __deferred navigation properties are not part of the record
+
+    return record
+
+
+def iterate_json_entries(source, base_url, page):
+    data = orjson.loads(source.read())["d"]
+    results = data if isinstance(data, list) else data.get("results", [])
+    if isinstance(data, dict) and data.get("__next"):
+        page["next_link"] = urljoin(base_url, data["__next"])
+
+    for i in range(len(results)):
+        record = get_json_record(results[i])
+        results[i] = None
+        page["entries"] += 1
+        yield record
+
+    page["complete"] = True
+
+
+def iterate_source_entries(source, content_type, base_url, page):
+    if "json" in content_type:
+        return iterate_json_entries(source, base_url, page)
+
+    return iterate_atom_entries(source, page)
+
+
+def iterate_entries(response, page):
+    return iterate_source_entries(response.raw, response.headers.get("Content-Type", ""), response.url, page)
+
+
+def get_response_bytes(response):
+    # Body bytes as they came over the wire, before gzip is undone
+    try:
+        return response.raw.tell()
+    except Exception:
+        return 0
+
+
+def iterate_timed_entries(entries, entity=None):
+    # Times reading and decoding the entries as "parse", what the caller does with each entry in between is not counted
+    seconds = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            record = next(entries, None)
+            seconds += time.perf_counter() - start
+            if record is None:
+                return
+            yield record
+    finally:
+        add_time(entity, "parse", seconds)
+
+
+def consume_page(get_page, link, consume, entity=None, position=0):
+    # Streams the page's entries into consume(entries), only one entry is decoded at a time. A body that breaks off
+    # raises out of consume, which drops whatever it kept of that attempt, and the page is requested again.
+    # Returns (what consume returned, page), or None when the page still fails after the retries
+    for attempt in range(RETRIES + 1):
+        response = get_page(link)
+        if response is None:
+            return None
+
+        page = new_page(position)
+        entries = iterate_timed_entries(iterate_entries(response, page), entity)
+        try:
+            result = consume(entries)
+            # The next link trails the entries, read whatever the caller left behind
+            for _ in entries:
+                pass
+        except READ_ERRORS as e:
+            if attempt == RETRIES:
+                logger.error("Could not read page: {}, message: {}".format(link, e))
+                return None
+            delay = get_backoff(attempt)
+            logger.warning("Could not read page: {}, message: {}, retrying in {:.1f}s".format(link, e, delay))
+            time.sleep(delay)
+            continue
+        finally:
+            entries.close()
+            count(entity, "bytes", get_response_bytes(response))
+            response.close()
+
+        return result, page
+
+
+def read_page(get_page, link, entity=None, position=0):
+    # The whole page as a list, for the concurrent workers that read pages ahead of their turn
+    return consume_page(get_page, link, list, entity, position)
+
+
+def get_page_error(page_number, link):
+    # A page that still fails after the retries fails the entity rather than loading it with pages missing,
+    # a streamed load can then continue from this page with --resume
+    return RuntimeError("Page: {} could not be read, link: {}".format(page_number, link or "the first request"))
+
+
+def iterate_pages(get_page, progress=None, entity=None, consume=list):
+    # Yields what consume(entries) returned for every page, consume is called again for a page that is read again
+    progress = progress if progress is not None else new_progress()
+    progress["paging"] = LINK_PAGING
+    next_link = progress["next_link"]
+    page_number = progress["pages"]
+    if page_number and next_link is None:
+        logger.info("All {} pages were read by the resumed run".format(page_number))
+        return
+
+    while True:
+        result = consume_page(get_page, next_link, consume, entity, page_number + 1)
+        if result is None:
+            raise get_page_error(page_number + 1, next_link)
+
+        consumed, page = result
+        progress["page"] = page
+        yield consumed
+
+        page_number += 1
+        logger.info("Parsed page: {}, entries: {}".format(page_number, page["entries"]))
+
+        next_link = page["next_link"]
+        if next_link is None:
+            logger.info("Last page reached after {} pages".format(page_number))
+            return
+
+
+def read_entries(response):
+    # For small unpaged feeds (e.g. function imports) where the connection should be released straight away
+    page = new_page()
+    try:
+        return list(iterate_entries(response, page))
+    finally:
+        response.close()
+
+
+def read_body_entries(body, content_type, base_url):
+    # Same as read_entries for a feed that is already in memory, e.g. a $batch part
+    return list(iterate_source_entries(io.BytesIO(body), content_type, base_url, new_page()))
+
+
+def get_batch_body(paths, boundary, headers=None):
+    # One GET per part, paths are relative to the service root
+    lines = []
+    for path in paths:
+        lines += ["--" + boundary, "Content-Type: application/http", "Content-Transfer-Encoding: binary", "",
+                  "GET {} HTTP/1.1".format(quote(path, safe="/?&=$(),'*:+"))]
+        lines += ["{}: {}".format(name, value) for name, value in (headers or {}).items()]
+        lines += ["", ""]
+    lines += ["--{}--".format(boundary), ""]
+    return "\r\n".join(lines).encode()
+
+
+def parse_batch_part(part):
+    # MIME part headers, then the embedded HTTP response: status line, headers and body
+    _, message = BLANK_LINE.split(part, 1)
+    head, body = BLANK_LINE.split(message, 1) if BLANK_LINE.search(message) else (message, b"")
+    head_lines = head.decode("latin-1").splitlines()
+    headers = CaseInsensitiveDict()
+    for line in head_lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+
+    return {"status": int(head_lines[0].split()[1]), "headers": headers, "body": body}
+
+
+def parse_batch_response(content, content_type):
+    # Parts come back in request order
+    boundary = BOUNDARY_PATTERN.search(content_type).group(1).encode()
+    parts = []
+    for part in content.split(b"--" + boundary)[1:]:
+        if part.startswith(b"--"):
+            break
+        # The CRLF before the next delimiter belongs to the delimiter
+        if part.endswith(b"\r\n"):
+            part = part[:-2]
+        parts.append(parse_batch_part(part.lstrip(b"\r\n")))
+
+    return parts
+
+
+def batch_get(service_url, paths, headers=None):
+    # Sends the GETs as one $batch request, returns a {"status", "headers", "body"} dict per path
+    # in order, or None when the batch itself failed
+    service_url = service_url.rstrip("/")
+    boundary = "batch_{}".format(uuid.uuid4().hex)
+    response = sap_post(service_url + "/$batch", get_batch_body(paths, boundary, headers),
+                        headers={"Content-Type": "multipart/mixed; boundary={}".format(boundary)},
+                        token_url=service_url + "/")
+    if response.status_code not in (200, 202):
+        logger.error("Batch request to: {} failed, status code: {}, content: {}".format(service_url,
+                                                                                       response.status_code,
+                                                                                       get_body_sample(response)))
+        return None
+
+    parts = parse_batch_response(response.content, response.headers.get("Content-Type", ""))
+    if len(parts) != len(paths):
+        logger.error("Batch request to: {} returned {} parts for {} requests".format(service_url, len(parts),
+                                                                                     len(paths)))
+        return None
+
+    return parts
+
+
+def get_count(url, params=None):
+    # $count honours $filter but not $select/$orderby
+    count_params = {k: v for k, v in (params or {}).items() if k == "$filter"}
+    response = sap_get(url.rstrip("/") + "/$count", params=count_params)
+    if response.status_code != 200:
+        logger.error("Could not count: {}, status code: {}, content: {}".format(url, response.status_code,
+                                                                               get_body_sample(response)))
+        return None
+
+    return int(response.text)
+
+
+def get_page_links(url, params, count, page_size):
+    # params should carry an $orderby on the keys, without one SAP does not promise the same order per request
+    # and $skip pages can overlap or miss rows
+    separator = "&" if "?" in url else "?"
+    links = []
+    for skip in range(0, count, page_size):
+        page_params = dict(params or {})
+        page_params.update({"$top": page_size, "$skip": skip})
+        links.append(url + separator + urlencode(page_params, safe="$,'():", quote_via=quote))
+
+    return links
+
+
+def get_short_page_error(page_number, link, entries, page_size, next_link):
+    # SAP caps $top at the service's server page size and puts the rest behind a next link,
+    # a plan with larger pages would load the entity with rows missing
+    return RuntimeError("Page: {} returned {} of {} records{}, link: {}, lower ODATA_PAGE_SIZE (or the descriptor's "
+                        "page_size) to the service's server page size".format(
+                            page_number, entries, page_size, " and a next link" if next_link is not None else "", link))
+
+
+def iterate_pages_concurrently(get_page, links, concurrency, page_size, progress=None, entity=None, consume=list):
+    # Pages are requested by a bounded pool but handed to consume strictly in page order.
+    # Only a window of 2 x concurrency pages is held in memory at a time.
+    progress = progress if progress is not None else new_progress()
+    progress["paging"] = SKIP_PAGING
+    progress["page_size"] = page_size
+    page_number = progress["pages"]
+    if page_number:
+        logger.info("Skipping {} pages read by the resumed run".format(page_number))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        remaining = iter(links[page_number:])
+        for link in remaining:
+            pending.append((link, executor.submit(read_page, get_page, link, entity)))
+            if len(pending) >= 2 * concurrency:
+                break
+
+        while pending:
+            link, future = pending.popleft()
+            for next_link in remaining:
+                pending.append((next_link, executor.submit(read_page, get_page, next_link, entity)))
+                break
+
+            page_number += 1
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error("Exception raised while fetching page: {}, message: {}".format(link, e))
+                result = None
+
+            if result is None:
+                # Later pages must not land before this one, or a resumed run would skip it
+                raise get_page_error(page_number, link)
+
+            records, page = result
+            # Only the last page of the plan may be short
+            if page["next_link"] is not None or (page_number < len(links) and len(records) < page_size):
+                raise get_short_page_error(page_number, link, len(records), page_size, page["next_link"])
+
+            logger.info("Parsed page: {} of {}, entries: {}".format(page_number, len(links), len(records)))
+            progress["page"] = dict(new_page(page_number), complete=True, entries=len(records))
+            yield consume(iter(records))
+
+
+def get_resumed_paging(progress):
+    # How the run to continue requested its pages, None when starting from the first page
+    if progress is None or not progress["pages"]:
+        return None
+    if progress["paging"] is None and progress["next_link"] is None:
+        raise RuntimeError("The checkpoint does not say how its {} pages were requested, "
+                           "run without --resume".format(progress["pages"]))
+    return progress["paging"] or LINK_PAGING
+
+
+def iterate_entity_pages(get_page, url, params=None, entity=None, page_size=DEFAULT_PAGE_SIZE, progress=None,
+                         order_by=None, consume=list):
+    # order_by: comma separated key properties, the $orderby of the concurrent $top/$skip pages.
+    # consume(entries) is called once per page (again when the page is read again), its results are yielded
+    concurrency = DEFAULT_CONCURRENCY
+    if entity is not None:
+        concurrency = int(os.getenv("{}_CONCURRENCY".format(entity), concurrency))
+
+    # A resumed run continues the way it requested its pages, whatever the concurrency is now: from its next link,
+    # or from page N of the same $skip plan (a next link cannot tell which rows the first N $skip pages held)
+    paging = get_resumed_paging(progress)
+    if paging == LINK_PAGING or (paging is None and concurrency <= 1):
+        return iterate_pages(get_page, progress, entity, consume)
+    if paging == SKIP_PAGING:
+        concurrency = max(concurrency, 1)
+        page_size = progress["page_size"] or page_size
+
+    # The count and every page of the plan use the same query options, the descriptor's own $orderby wins
+    plan_params = dict(params or {})
+    if order_by and "$orderby" not in plan_params:
+        plan_params["$orderby"] = order_by
+    elif "$orderby" not in plan_params:
+        logger.warning("No $orderby for the $skip pages of: {}, pages may overlap or miss rows".format(url))
+
+    record_count = get_count(url, plan_params)
+    if record_count is None and paging == SKIP_PAGING:
+        raise RuntimeError("Could not count: {}, the run resumed at $skip page: {} cannot continue".format(
+            url, progress["pages"]))
+    if record_count is None:
+        logger.error("Falling back to sequential paging for: {}".format(url))
+        return iterate_pages(get_page, progress, entity, consume)
+
+    logger.info("Fetching {} records from: {} with {} workers".format(record_count, url, concurrency))
+    return iterate_pages_concurrently(get_page, get_page_links(url, plan_params, record_count, page_size),
+                                      concurrency, page_size, progress, entity, consume)
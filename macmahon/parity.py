@@ -0,0 +1,61 @@
+import io
+import sys
+import logging
+
+from odata import new_page
+from odata import iterate_atom_entries
+from odata import iterate_json_entries
+from entities import ENTITIES
+from extraction import prepare_records
+from extraction import new_record_batch
+from columnar import get_rows
+
+logging.basicConfig(level="INFO")
+logger = logging.getLogger('FORMAT_PARITY')
+
+
+def get_records(entity, entries):
+    records = new_record_batch(entity)
+    prepare_records(entity, entries, records)
+    return get_rows(records)
+
+
+def compare_pages(entity_name, xml_page, json_page):
+    # Runs the entity's row extractor over a recorded Atom page and the same page
+    # recorded with $format=json, returns a list of (row, column, xml value, json value) mismatches
+    entity = ENTITIES[entity_name]
+    columns = entity["columns"]
+
+    xml_records = get_records(entity, iterate_atom_entries(io.BytesIO(xml_page), new_page()))
+    json_records = get_records(entity, iterate_json_entries(io.BytesIO(json_page), '', new_page()))
+    logger.info("{}: {} XML records, {} JSON records".format(entity_name, len(xml_records), len(json_records)))
+
+    mismatches = []
+    if len(xml_records) != len(json_records):
+        mismatches.append((None, "record count", len(xml_records), len(json_records)))
+
+    for row, (xml_record, json_record) in enumerate(zip(xml_records, json_records)):
+        if xml_record == json_record:
+            continue
+        for column, xml_value, json_value in zip(columns, xml_record, json_record):
+            if xml_value != json_value and not (xml_value != xml_value and json_value != json_value):
+                mismatches.append((row, column, xml_value, json_value))
+
+    return mismatches
+
+
+if __name__ == '__main__':
+    # python parity.py <entity> <recorded atom page> <recorded json page>
+    if len(sys.argv) != 4:
+        logger.error("Usage: parity.py <entity, one of: {}> <atom page> <json page>".format(", ".join(ENTITIES)))
+        sys.exit(2)
+
+    with open(sys.argv[2], "rb") as xml_file, open(sys.argv[3], "rb") as json_file:
+        differences = compare_pages(sys.argv[1], xml_file.read(), json_file.read())
+
+    for row, column, xml_value, json_value in differences:
+        logger.error("Row: {}, column: {}, XML: {!r}, JSON: {!r}".format(row, column, xml_value, json_value))
+
+    if differences:
+        sys.exit(1)
+    logger.info("XML and JSON pages produce identical records")
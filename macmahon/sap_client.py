@@ -0,0 +1,197 @@
+import os
+import re
+import time
+import random
+import logging
+import datetime
+import threading
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from metrics import count
+from metrics import get_current_entity
+
+logger = logging.getLogger('SAP_CLIENT')
+
+user = os.getenv("SAP_USER", "SAP_USERNAME")
+password = os.getenv("PASSWORD", "SAP_PASSWORD")
+
+# Pool size applies per SAP host, override a single host with SAP_POOL_SIZE_<HOST>
+# e.g. SAP_POOL_SIZE_ID_API_S4HANA_ONDEMAND_COM=20
+DEFAULT_POOL_SIZE = int(os.getenv("SAP_POOL_SIZE", "10"))
+# Above 0 the pool becomes a hard cap: at most this many requests per host are in flight across all threads,
+# further requests wait for a connection to come back (a streamed response holds it until closed)
+MAX_REQUESTS_PER_HOST = int(os.getenv("SAP_MAX_REQUESTS_PER_HOST", "0"))
+
+# Throttled (429), unavailable (503) and gateway errors (502/504), timeouts and dropped connections are retried
+# SAP_RETRIES times with exponential backoff and full jitter, or after the Retry-After SAP asks for
+RETRIES = int(os.getenv("SAP_RETRIES", "4"))
+BACKOFF = float(os.getenv("SAP_BACKOFF_SECONDS", "1"))
+BACKOFF_MAX = float(os.getenv("SAP_BACKOFF_MAX_SECONDS", "60"))
+RETRY_AFTER_MAX = float(os.getenv("SAP_RETRY_AFTER_MAX_SECONDS", "300"))
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# (connect, read) seconds, the read timeout applies to every wait for data, not to the whole response
+TIMEOUT = (float(os.getenv("SAP_CONNECT_TIMEOUT", "10")), float(os.getenv("SAP_READ_TIMEOUT", "300")))
+
+# Error bodies are logged up to LOG_BODY_BYTES, LOG_BODY_SAMPLE_RATE of them (0 to 1) are logged whole
+LOG_BODY_BYTES = int(os.getenv("LOG_BODY_BYTES", "500"))
+LOG_BODY_SAMPLE_RATE = float(os.getenv("LOG_BODY_SAMPLE_RATE", "0"))
+
+SAP_SESSION_COOKIES = ("SAP_SESSIONID", "MYSAPSSO2")
+
+sessions = {}
+sessions_lock = threading.Lock()
+# X-CSRF-Token per SAP host, the gateway requires one on every POST (including read-only $batch requests)
+csrf_tokens = {}
+
+
+def get_pool_size(host):
+    env_name = "SAP_POOL_SIZE_{}".format(re.sub("[^A-Za-z0-9]", "_", host).upper())
+    return int(os.getenv(env_name, DEFAULT_POOL_SIZE))
+
+
+def get_session(url):
+    parts = urlsplit(url)
+    with sessions_lock:
+        session = sessions.get(parts.netloc)
+        if session is None:
+            pool_size = get_pool_size(parts.netloc)
+            if MAX_REQUESTS_PER_HOST > 0:
+                pool_size = MAX_REQUESTS_PER_HOST
+            logger.info("Opening SAP session for host: {}, pool size: {}, blocking: {}".format(
+                parts.netloc, pool_size, MAX_REQUESTS_PER_HOST > 0))
+            session = requests.Session()
+            session.headers.update({"Accept-Encoding": "gzip, deflate"})
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=MAX_REQUESTS_PER_HOST > 0)
+            session.mount("{}://{}".format(parts.scheme, parts.netloc), adapter)
+            sessions[parts.netloc] = session
+
+    return session
+
+
+def has_sap_session(session):
+    return any(cookie.name.startswith(SAP_SESSION_COOKIES) for cookie in session.cookies)
+
+
+def get_retry_after(response):
+    # Retry-After is either seconds or an HTTP date
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+def get_backoff(attempt, response=None):
+    if response is not None and response.status_code in (429, 503):
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, RETRY_AFTER_MAX)
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF * 2 ** attempt))
+
+
+def get_body_sample(response):
+    # What to log of a response body, a gateway error page can be megabytes of HTML
+    try:
+        content = response.content
+    except Exception as e:
+        return "<body not readable: {}>".format(e)
+
+    if LOG_BODY_SAMPLE_RATE and random.random() < LOG_BODY_SAMPLE_RATE:
+        return content
+    if len(content) <= LOG_BODY_BYTES:
+        return content
+    return "{}... ({} bytes)".format(content[:LOG_BODY_BYTES], len(content))
+
+
+def send_request(method, url, params=None, stream=False, headers=None, data=None):
+    session = get_session(url)
+
+    # Once SAP has handed out a session cookie the gateway can skip the Basic auth check,
+    # fall back to credentials only when the cookie has expired
+    if has_sap_session(session):
+        response = session.request(method, url, params=params, stream=stream, headers=headers, data=data,
+                                   timeout=TIMEOUT)
+        if response.status_code != 401:
+            return response
+        logger.info("SAP session expired for: {}, re-authenticating".format(urlsplit(url).netloc))
+        response.close()
+        session.cookies.clear()
+
+    return session.request(method, url, params=params, stream=stream, headers=headers, data=data,
+                           auth=HTTPBasicAuth(user, password), timeout=TIMEOUT)
+
+
+def sap_request(method, url, params=None, stream=False, headers=None, data=None):
+    # Only GETs and read-only $batch POSTs go through here, so every request is safe to send again
+    for attempt in range(RETRIES + 1):
+        try:
+            response = send_request(method, url, params=params, stream=stream, headers=headers, data=data)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == RETRIES:
+                logger.error("Request to: {} failed after {} attempts, message: {}".format(url, attempt + 1, e))
+                raise
+            delay = get_backoff(attempt)
+            count(get_current_entity(), "retries")
+            logger.warning("Request to: {} failed, message: {}, retrying in {:.1f}s ({}/{})".format(
+                url, e, delay, attempt + 1, RETRIES))
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+        if attempt == RETRIES:
+            logger.error("Request to: {} still failing after {} attempts, status code: {}".format(
+                url, attempt + 1, response.status_code))
+            return response
+
+        delay = get_backoff(attempt, response)
+        count(get_current_entity(), "retries")
+        logger.warning("Request to: {} returned status code: {}, retrying in {:.1f}s ({}/{})".format(
+            url, response.status_code, delay, attempt + 1, RETRIES))
+        response.close()
+        time.sleep(delay)
+
+
+def sap_get(url, params=None, stream=False, headers=None):
+    return sap_request("GET", url, params=params, stream=stream, headers=headers)
+
+
+def fetch_csrf_token(url):
+    response = sap_get(url, headers={"X-CSRF-Token": "Fetch"})
+    response.close()
+    token = response.headers.get("X-CSRF-Token")
+    csrf_tokens[urlsplit(url).netloc] = token
+    return token
+
+
+def sap_post(url, data, headers=None, token_url=None):
+    # token_url: any GET-able URL of the service, the token is bound to the session cookie it is fetched with
+    host = urlsplit(url).netloc
+    token = csrf_tokens.get(host) or fetch_csrf_token(token_url or url)
+    response = sap_request("POST", url, headers=dict(headers or {}, **{"X-CSRF-Token": token}), data=data)
+    if response.status_code == 403 and response.headers.get("X-CSRF-Token", "").lower() == "required":
+        logger.info("CSRF token expired for: {}, fetching a new one".format(host))
+        response.close()
+        token = fetch_csrf_token(token_url or url)
+        response = sap_request("POST", url, headers=dict(headers or {}, **{"X-CSRF-Token": token}), data=data)
+
+    return response
+
+
+def close_sessions():
+    with sessions_lock:
+        for session in sessions.values():
+            session.close()
+        sessions.clear()
+        csrf_tokens.clear()
@@ -0,0 +1,44 @@
+import queue
+import threading
+
+from columnar import get_rows
+
+# Rows of an entity handed to other jobs of the same run while the entity is still being extracted,
+# e.g. the work order IDs the attachment job needs
+subscriptions = {}
+subscriptions_lock = threading.Lock()
+
+
+def subscribe(entity_name):
+    # Must be called before the entity starts, rows published earlier are not replayed
+    snapshot = queue.Queue()
+    with subscriptions_lock:
+        subscriptions.setdefault(entity_name, []).append(snapshot)
+    return snapshot
+
+
+def publish(entity_name, records, start=0):
+    # records: the entity's columnar batch, only turned back into row tuples when someone subscribed
+    with subscriptions_lock:
+        snapshots = list(subscriptions.get(entity_name, ()))
+    if snapshots:
+        rows = get_rows(records, start)
+        for snapshot in snapshots:
+            snapshot.put(rows)
+
+
+def close_snapshot(entity_name):
+    # Tells the subscribers the entity is done, safe to call more than once
+    with subscriptions_lock:
+        snapshots = subscriptions.pop(entity_name, [])
+    for snapshot in snapshots:
+        snapshot.put(None)
+
+
+def iterate_snapshot(snapshot):
+    # Yields the rows of every parsed page until the entity is done
+    while True:
+        rows = snapshot.get()
+        if rows is None:
+            return
+        yield rows
@@ -0,0 +1,122 @@
+import os
+import sys
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import send_batch_to_load_table
+from utils import finalise_load_table
+from utils import get_key_types
+from watermarks import get_max_watermark
+from watermarks import set_watermark
+from checkpoints import set_checkpoint
+from checkpoints import clear_checkpoint
+from metrics import timer
+from columnar import get_frame
+from columnar import clear_batch
+
+logger = logging.getLogger('STREAMING')
+
+# STREAM_TO_SQL=true writes every STREAM_FLUSH_PAGES parsed pages to the database instead of the whole entity at the end
+STREAM_TO_SQL = os.getenv("STREAM_TO_SQL", "false").lower() == "true"
+STREAM_FLUSH_PAGES = int(os.getenv("STREAM_FLUSH_PAGES", "1"))
+
+
+def get_batch(page_records, keys=None, convert=None, entity_name=None):
+    with timer(entity_name, "transform"):
+        data = get_frame(page_records)
+        clear_batch(page_records)
+        if keys:
+            data = data.drop_duplicates(subset=keys, keep="last")
+        if convert is not None:
+            data = convert(data)
+        data['lastupdatedtime'] = datetime.datetime.now()
+    return data
+
+
+def write_batch(data, table_name, first_batch, dtype=None, entity_name=None, state=None):
+    # state: the checkpoint once this batch is in the load table, stored by the writer as soon as it has landed
+    # so a resumed run never appends the batch a second time
+    with timer(entity_name, "write"):
+        send_batch_to_load_table(data, table_name, first_batch, dtype)
+    if entity_name is not None and state is not None:
+        set_checkpoint(entity_name, state)
+
+
+def wait_for_write(pending, table_name):
+    try:
+        pending.result()
+    except Exception as e:
+        logger.error("Exception raised while streaming to table: {}, message: {}, exiting".format(table_name, e))
+        sys.exit(1)
+
+
+def iterate_batches(pages, keys=None, convert=None, entity_name=None):
+    # pages yields the module's columnar record batch once per parsed page, drained every STREAM_FLUSH_PAGES pages
+    page_records = None
+    for page_number, page_records in enumerate(pages, 1):
+        if page_number % STREAM_FLUSH_PAGES == 0 and page_records["rows"]:
+            yield get_batch(page_records, keys, convert, entity_name)
+
+    if page_records is not None and page_records["rows"]:
+        yield get_batch(page_records, keys, convert, entity_name)
+
+
+def get_checkpoint_state(progress, batches, total_records, watermark):
+    return {"next_link": progress["next_link"], "pages": progress["pages"], "paging": progress["paging"],
+            "page_size": progress["page_size"], "batches": batches, "records": total_records,
+            "watermark": None if watermark is None else str(watermark)}
+
+
+def stream_pages_to_sql(pages, table_name, mode="replace", keys=None, watermark_entity=None, convert=None,
+                        dtype=None, progress=None, entity_name=None, checkpoint=None):
+    # Batches are written by a single background writer while the next pages are fetched,
+    # so at most one batch is being written and one accumulated at any time.
+    # With entity_name the stages are timed under it and the position after every landed batch is stored,
+    # a resumed run passes that checkpoint back and keeps appending to the same load table
+    checkpoint = checkpoint or {}
+    total_records = checkpoint.get("records", 0)
+    batches = checkpoint.get("batches", 0)
+    watermark = pd.Timestamp(checkpoint["watermark"]) if checkpoint.get("watermark") else None
+    pending = None
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for data in iterate_batches(pages, keys if mode == "upsert" else None, convert, entity_name):
+            if watermark_entity is not None:
+                batch_watermark = get_max_watermark(data)
+                if batch_watermark is not None and (watermark is None or batch_watermark > watermark):
+                    watermark = batch_watermark
+
+            if pending is not None:
+                wait_for_write(pending, table_name)
+            # An upsert target created from the load table is indexed on the keys, they need an indexable type
+            batch_dtype = get_key_types(data, keys, dtype) if mode == "upsert" else dtype
+            first_batch = batches == 0
+            batches += 1
+            total_records += data.shape[0]
+            state = get_checkpoint_state(progress, batches, total_records, watermark) if progress is not None else None
+            pending = writer.submit(write_batch, data, table_name, first_batch, batch_dtype, entity_name, state)
+            logger.info("Queued batch: {} of {} records for table: {}".format(batches, data.shape[0], table_name))
+
+        if pending is not None:
+            wait_for_write(pending, table_name)
+
+    if batches == 0:
+        logger.info("No records received for table: {}, leaving it untouched".format(table_name))
+        return total_records
+
+    try:
+        with timer(entity_name, "write"):
+            finalise_load_table(table_name, mode, keys)
+    except Exception as e:
+        logger.error("Exception raised while finalising table: {}, message: {}, exiting".format(table_name, e))
+        sys.exit(1)
+
+    if watermark is not None:
+        set_watermark(watermark_entity, watermark)
+    if entity_name is not None:
+        clear_checkpoint(entity_name)
+
+    logger.info("Streamed {} records in {} batches to table: {}".format(total_records, batches, table_name))
+    return total_records
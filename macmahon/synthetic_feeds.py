@@ -0,0 +1,233 @@
+import re
+import random
+import datetime
+from xml.sax.saxutils import escape
+from xml.sax.saxutils import quoteattr
+
+import orjson
+
+from extraction import STR, INT, INT_OR_ZERO, FLOAT, ID, DATE, DATETIMEOFFSET, TIME
+from metadata import get_service_root
+from metadata import get_entity_set_name
+
+# Synthetic SAP feeds shaped by the entity descriptors: one property per column, values of the width and
+# repetitiveness SAP sends (short codes out of a small set, free text in names and descriptions, ~5% m:null)
+NULL_SHARE = 0.05
+CODES_PER_COLUMN = 20
+WORDS = ("pump", "valve", "inspection", "replace", "seal", "bearing", "motor", "check", "leak", "filter", "service",
+         "annual", "belt", "conveyor", "gearbox", "lubricate", "calibrate", "sensor", "pressure", "safety", "repair",
+         "overhaul", "crusher", "screen", "electrical", "hydraulic", "hose", "liner", "shutdown", "planned")
+TEXT_NAMES = ("Name", "Desc", "Text", "Description", "Title")
+DECIMAL_NAMES = ("Quantity", "Qty", "Amount", "Amt", "Price", "Volume", "Percentage", "Weight")
+KEY_NAMES = ("ID", "Reservation", "MaintenanceOrder", "PurchaseOrder", "MaintenanceNotification")
+FLAG_PATTERN = re.compile(r"(^|[a-z])Is[A-Z]|(Indicator|Flag)$")
+START_DATE = datetime.datetime(2018, 1, 1)
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# What a property holds, decided from its conversion and name: drives its values and its $metadata type
+TEXT = "text"
+DECIMAL = "decimal"
+FLAG = "flag"
+DATE_TEXT = "date_text"
+KEY = "key"
+CODE = "code"
+NULLABLE_KINDS = (DATE, TIME, TEXT, DECIMAL, FLAG, DATE_TEXT, CODE)
+
+EDM_TYPES = {
+    ID: ('Edm.String', 'MaxLength="20"'),
+    INT: ("Edm.Int32", ""),
+    INT_OR_ZERO: ("Edm.Int32", ""),
+    FLOAT: ("Edm.Double", ""),
+    DATE: ("Edm.DateTime", 'Precision="0" sap:display-format="Date"'),
+    DATETIMEOFFSET: ("Edm.DateTimeOffset", 'Precision="7"'),
+    TIME: ("Edm.Time", 'Precision="0"'),
+    TEXT: ("Edm.String", 'MaxLength="255"'),
+    DECIMAL: ("Edm.Decimal", 'Precision="13" Scale="3"'),
+    FLAG: ("Edm.Boolean", ""),
+    DATE_TEXT: ("Edm.String", 'MaxLength="19"'),
+    KEY: ("Edm.String", 'MaxLength="10"'),
+    CODE: ("Edm.String", 'MaxLength="10"'),
+}
+
+ATOM_FEED = ('<?xml version="1.0" encoding="utf-8"?><feed xml:base="{base}" xmlns="http://www.w3.org/2005/Atom" '
+             'xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata" '
+             'xmlns:d="http://schemas.microsoft.com/ado/2007/08/dataservices"><id>{base}{entity_set}</id>'
+             '<title type="text">{entity_set}</title><updated>{updated}</updated>'
+             '<author><name/></author><link href="{entity_set}" rel="self" title="{entity_set}"/>')
+ATOM_ENTRY = ('<entry><id>{base}{entity_set}(\'{key}\')</id><title type="text">{entity_set}(\'{key}\')</title>'
+              '<updated>{updated}</updated><category term="{entity_set}Type" '
+              'scheme="http://schemas.microsoft.com/ado/2007/08/dataservices/scheme"/>'
+              '<link href="{entity_set}(\'{key}\')" rel="edit" title="{entity_set}Type"/>'
+              '<content type="application/xml"><m:properties>')
+METADATA_DOCUMENT = ('<?xml version="1.0" encoding="utf-8"?><edmx:Edmx Version="1.0" '
+                     'xmlns:edmx="http://schemas.microsoft.com/ado/2007/06/edmx" '
+                     'xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata" '
+                     'xmlns:sap="http://www.sap.com/Protocols/SAPData"><edmx:DataServices m:DataServiceVersion="2.0">'
+                     '<Schema Namespace="{namespace}" xml:lang="en" '
+                     'xmlns="http://schemas.microsoft.com/ado/2008/09/edm">{entity_types}'
+                     '<EntityContainer Name="{namespace}_Entities" m:IsDefaultEntityContainer="true">{entity_sets}'
+                     '</EntityContainer></Schema></edmx:DataServices></edmx:Edmx>')
+
+codes = {}
+
+
+def get_property_kind(prop, conversion):
+    if conversion != STR and conversion in EDM_TYPES:
+        return conversion
+    if any(name in prop for name in TEXT_NAMES):
+        return TEXT
+    if any(name in prop for name in DECIMAL_NAMES):
+        return DECIMAL
+    if FLAG_PATTERN.search(prop):
+        return FLAG
+    if prop.endswith("Date"):
+        return DATE_TEXT
+    if prop in KEY_NAMES:
+        return KEY
+    return CODE
+
+
+def get_feed_properties(entity):
+    # [(property, kind)] in column order, each property once
+    properties = entity.get("properties", {})
+    conversions = entity.get("conversions", {})
+    feed_properties = {}
+    for column in entity["columns"]:
+        prop = properties.get(column, column)
+        if prop not in feed_properties:
+            feed_properties[prop] = get_property_kind(prop, conversions.get(column, STR))
+
+    return list(feed_properties.items())
+
+
+def get_codes(prop):
+    # The same small set of codes for a property on every run
+    property_codes = codes.get(prop)
+    if property_codes is None:
+        rng = random.Random(prop)
+        length = rng.randint(2, 10)
+        property_codes = ["".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(length))
+                          for _ in range(CODES_PER_COLUMN)]
+        codes[prop] = property_codes
+
+    return property_codes
+
+
+def get_value(rng, prop, kind, row):
+    if kind in NULLABLE_KINDS and rng.random() < NULL_SHARE:
+        return None
+
+    if kind == ID:
+        return "ORD{:012d}".format(row)
+    if kind == KEY:
+        return "{:010d}".format(row)
+    if kind in (INT, INT_OR_ZERO):
+        return str(rng.randint(0, 9))
+    if kind == FLOAT:
+        return "{:.2f}".format(rng.uniform(0, 100000))
+    if kind in (DATE, DATE_TEXT):
+        return (START_DATE + datetime.timedelta(days=rng.randint(0, 3000))).strftime("%Y-%m-%dT00:00:00")
+    if kind == DATETIMEOFFSET:
+        changed = START_DATE + datetime.timedelta(seconds=rng.randint(0, 3000 * 86400))
+        return changed.strftime("%Y-%m-%dT%H:%M:%SZ")
+    if kind == TIME:
+        return "PT{:02d}H{:02d}M{:02d}S".format(rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))
+    if kind == TEXT:
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))).capitalize()
+    if kind == DECIMAL:
+        return "{:.3f}".format(rng.uniform(0, 10000))
+    if kind == FLAG:
+        return rng.choice(("true", "false"))
+    return rng.choice(get_codes(prop))
+
+
+def get_rows(entity, rows, start=0, seed=0):
+    # rows {property: value} dicts, row numbers from start on; the same arguments give the same rows
+    rng = random.Random("{}-{}-{}".format(entity["name"], start, seed))
+    feed_properties = get_feed_properties(entity)
+    return [{prop: get_value(rng, prop, kind, row) for prop, kind in feed_properties}
+            for row in range(start, start + rows)]
+
+
+def get_atom_page(entity, rows, next_link=None, base_url=None, start=0):
+    # One Atom feed page the way the SAP gateway writes it, next_link relative to the feed's xml:base
+    base = base_url or get_service_root(entity["url"]) + "/"
+    entity_set = get_entity_set_name(entity["url"])
+    updated = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    parts = [ATOM_FEED.format(base=base, entity_set=entity_set, updated=updated)]
+    for number, row in enumerate(rows):
+        parts.append(ATOM_ENTRY.format(base=base, entity_set=entity_set, updated=updated, key=start + number))
+        for prop, value in row.items():
+            if value is None:
+                parts.append('<d:{0} m:null="true"/>'.format(prop))
+            else:
+                parts.append("<d:{0}>{1}</d:{0}>".format(prop, escape(value)))
+        parts.append("</m:properties></content></entry>")
+
+    if next_link:
+        parts.append('<link href="{}" rel="next"/>'.format(escape(next_link)))
+    parts.append("</feed>")
+    return "".join(parts).encode("utf-8")
+
+
+def get_atom_pages(entity, rows, pages, seed=0):
+    # pages consecutive pages of rows entries each, linked through $skiptoken like a server paged feed
+    entity_set = get_entity_set_name(entity["url"])
+    return [get_atom_page(entity, get_rows(entity, rows, page * rows, seed),
+                          "{}?$skiptoken={}".format(entity_set, (page + 1) * rows) if page < pages - 1 else None,
+                          start=page * rows)
+            for page in range(pages)]
+
+
+def get_json_ticks(value, pattern):
+    return int((datetime.datetime.strptime(value, pattern) - EPOCH).total_seconds() * 1000)
+
+
+def get_json_value(value, kind):
+    # OData v2 JSON: Edm.DateTime as /Date(ms)/, Edm.DateTimeOffset as /Date(ms+offset)/, booleans as such
+    if value is None:
+        return None
+    if kind == DATE:
+        return "/Date({})/".format(get_json_ticks(value, "%Y-%m-%dT%H:%M:%S"))
+    if kind == DATETIMEOFFSET:
+        return "/Date({}+0000)/".format(get_json_ticks(value, "%Y-%m-%dT%H:%M:%SZ"))
+    if kind == FLAG:
+        return value == "true"
+    return value
+
+
+def get_json_page(entity, rows, next_link=None, base_url=None, start=0):
+    # The same page as get_atom_page with $format=json, the next link is absolute
+    base = base_url or get_service_root(entity["url"]) + "/"
+    entity_set = get_entity_set_name(entity["url"])
+    kinds = dict(get_feed_properties(entity))
+    results = []
+    for number, row in enumerate(rows):
+        uri = "{}{}('{}')".format(base, entity_set, start + number)
+        result = {"__metadata": {"id": uri, "uri": uri, "type": "{}Type".format(entity_set)}}
+        for prop, value in row.items():
+            result[prop] = get_json_value(value, kinds.get(prop))
+        results.append(result)
+
+    data = {"results": results}
+    if next_link:
+        data["__next"] = base + next_link
+    return orjson.dumps({"d": data})
+
+
+def get_metadata_document(namespace, entities):
+    # $metadata of a service holding the entities' sets, typed the way their values are generated
+    entity_types = []
+    entity_sets = []
+    for entity in entities:
+        entity_set = get_entity_set_name(entity["url"])
+        feed_properties = get_feed_properties(entity)
+        properties = "".join('<Property Name={} Type="{}" Nullable="true" {}/>'.format(quoteattr(prop),
+                                                                                        *EDM_TYPES[kind])
+                             for prop, kind in feed_properties)
+        entity_types.append('<EntityType Name="{0}Type"><Key><PropertyRef Name="{1}"/></Key>{2}'
+                            '</EntityType>'.format(entity_set, feed_properties[0][0], properties))
+        entity_sets.append('<EntitySet Name="{0}" EntityType="{1}.{0}Type"/>'.format(entity_set, namespace))
+
+    return METADATA_DOCUMENT.format(namespace=namespace, entity_types="".join(entity_types),
+                                    entity_sets="".join(entity_sets)).encode("utf-8")
@@ -1,15 +1,31 @@
 import sys
 import os
+import threading
 
 import logging as logger
 import pandas as pd
 
 from urllib.parse import quote_plus
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.dialects.mssql import NVARCHAR
 
+# "replace" (default) rewrites each table, "upsert" merges the batch into it on the entity's business keys
+LOAD_MODE = os.getenv("LOAD_MODE", "replace").lower()
 
-def send_df_to_sql(data, table_name, mode="replace"):
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# Loads running at the same time in this process, each one holds a connection and fills the transaction log
+SQL_MAX_WRITERS = int(os.getenv("SQL_MAX_WRITERS", "2"))
+sql_writers = threading.BoundedSemaphore(SQL_MAX_WRITERS)
 
+# Length of business key columns that have no type of their own, SQL Server cannot index NVARCHAR(max)
+KEY_MAX_LENGTH = int(os.getenv("KEY_MAX_LENGTH", "128"))
+
+engines = {}
+engines_lock = threading.Lock()
+
+
+def get_connection_string():
     server_name = os.getenv("SERVER_NAME", "mah-azu-sql01.database.windows.net")
     db_nam = os.getenv("DB_NAME", "DevMacDB")
     username = os.getenv("DB_USER", "pb_admin")
@@ -17,32 +33,186 @@ def send_df_to_sql(data, table_name, mode="replace"):
 
     # azure sql connect tion string
     conn = 'Driver={ODBC Driver 17 for SQL Server};Server='+ server_name + ';Database=' + db_nam +';Uid=' + username +';Pwd=' + password +';Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30;'
-    quoted = quote_plus(conn)
-    engine = create_engine('mssql+pyodbc:///?odbc_connect={}'.format(quoted))
-    logger.info("Connection string: {}".format(conn))
-
-    @event.listens_for(engine, 'before_cursor_execute')
-    def receive_before_cursor_execute(conn, cursor, statement, params, context, executemany):
-        logger.info("FUNC call")
-        if executemany:
-            cursor.fast_executemany = True
-    logger.info("Inserting records into the table: {}".format(table_name))
+    return conn
+
+
+def get_engine():
+    # One engine (and connection pool) per connection string for the whole process, so the ODBC driver
+    # setup and the Azure SQL login/TLS handshake are paid once rather than on every load
+    conn = get_connection_string()
+    with engines_lock:
+        engine = engines.get(conn)
+        if engine is None:
+            quoted = quote_plus(conn)
+            engine = create_engine('mssql+pyodbc:///?odbc_connect={}'.format(quoted), pool_pre_ping=True,
+                                   pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+            logger.info("Created SQL Server engine, pool size: {}".format(DB_POOL_SIZE))
+            event.listen(engine, 'before_cursor_execute', receive_before_cursor_execute)
+            engines[conn] = engine
+
+    return engine
+
+
+def receive_before_cursor_execute(conn, cursor, statement, params, context, executemany):
+    if executemany:
+        cursor.fast_executemany = True
+
+
+def dispose_engines():
+    with engines_lock:
+        for engine in engines.values():
+            engine.dispose()
+        engines.clear()
+
+
+def get_merge_statement(table_name, source, columns, keys):
+    key_match = " AND ".join("t.[{0}] = s.[{0}]".format(key) for key in keys)
+    column_list = ", ".join("[{}]".format(column) for column in columns)
+    value_list = ", ".join("s.[{}]".format(column) for column in columns)
+    updates = ", ".join("t.[{0}] = s.[{0}]".format(column) for column in columns if column not in keys)
+
+    statement = "MERGE dbo.[{}] WITH (HOLDLOCK) AS t USING {} AS s ON {} ".format(table_name, source, key_match)
+    if updates:
+        statement += "WHEN MATCHED THEN UPDATE SET {} ".format(updates)
+    statement += "WHEN NOT MATCHED BY TARGET THEN INSERT ({}) VALUES ({});".format(column_list, value_list)
+    return statement
+
+
+def get_dedup_statement(table_name, keys, latest):
+    # Deletes all but the row with the highest latest column of each key
+    return ("WITH ranked AS (SELECT ROW_NUMBER() OVER (PARTITION BY {} ORDER BY [{}] DESC) AS row_rank "
+            "FROM dbo.[{}]) DELETE FROM ranked WHERE row_rank > 1;".format(
+                ", ".join("[{}]".format(key) for key in keys), latest, table_name))
+
+
+def get_sql_frame(data):
+    # pyodbc binds neither timedelta nor tz-aware timestamps: durations go out as TIME values, offsets as UTC
+    converted = None
+    for column, dtype in data.dtypes.items():
+        if pd.api.types.is_timedelta64_dtype(dtype):
+            converted = data.copy() if converted is None else converted
+            present = data[column].notnull()
+            times = pd.Series(None, index=data.index, dtype=object)
+            times[present] = (pd.Timestamp("1970-01-01") + data[column][present]).dt.time
+            converted[column] = times
+        elif pd.api.types.is_datetime64tz_dtype(dtype):
+            converted = data.copy() if converted is None else converted
+            converted[column] = data[column].dt.tz_convert("UTC").dt.tz_localize(None)
+
+    return data if converted is None else converted
+
+
+def get_key_types(data, keys, dtype=None):
+    # dtype with a bounded NVARCHAR for the string keys it leaves untyped, so the keys can be indexed.
+    # Strings come out as object columns, or as StringDtype once pandas 3 infers them
+    key_types = dict(dtype or {})
+    for key in keys:
+        if key not in key_types and (pd.api.types.is_string_dtype(data[key]) or
+                                     pd.api.types.is_object_dtype(data[key])):
+            key_types[key] = NVARCHAR(KEY_MAX_LENGTH)
+    return key_types
+
+
+def create_key_index(table_name, keys, conn):
+    # Keeps the keys unique and lets every MERGE seek its rows instead of scanning and locking the whole table
+    conn.execute("CREATE UNIQUE CLUSTERED INDEX [ux_{0}_keys] ON dbo.[{0}] ({1})".format(
+        table_name, ", ".join("[{}]".format(key) for key in keys)))
+
+
+def upsert_df_to_sql(data, table_name, keys, conn, dtype=None):
+    if not keys:
+        raise ValueError("Upsert into: {} needs business keys".format(table_name))
+
+    # The latest record of a key wins: MERGE rejects a source that matches the same target row twice,
+    # and a new table must not start with duplicate keys
+    data = data.drop_duplicates(subset=keys, keep="last")
+
+    if not conn.dialect.has_table(conn, table_name, schema='dbo'):
+        data.to_sql(table_name, conn, index=False, if_exists="replace", schema='dbo',
+                    dtype=get_key_types(data, keys, dtype))
+        create_key_index(table_name, keys, conn)
+        return
+
+    # Bulk load the batch into a session temp table, then merge it into the target in one statement
+    staging_table = "#{}_staging".format(table_name)
+    conn.execute("DROP TABLE IF EXISTS [{}]".format(staging_table))
+    data.to_sql(staging_table, conn, index=False, if_exists="append", dtype=dtype)
+    conn.execute(get_merge_statement(table_name, "[{}]".format(staging_table), list(dict.fromkeys(data.columns)),
+                                     keys))
+    conn.execute("DROP TABLE [{}]".format(staging_table))
+
+
+def write_df_to_sql(data, table_name, mode, keys, conn, dtype=None):
+    sql_data = get_sql_frame(data)
+    if mode == "upsert":
+        upsert_df_to_sql(sql_data, table_name, keys, conn, dtype)
+    else:
+        sql_data.to_sql(table_name, conn, index=False, if_exists=mode, schema='dbo', dtype=dtype)
+    logger.info("Successfully inserted {} records to SQL Server table: {}".format(data.shape[0], table_name))
+
+
+def send_df_to_sql(data, table_name, mode="replace", keys=None, dtype=None):
+    send_dfs_to_sql([(data, table_name, keys, dtype)], mode)
+
+
+def send_dfs_to_sql(frames, mode="replace"):
+    # frames: (data, table name, business keys, SQL types) loaded over one pooled connection in a single transaction
+    engine = get_engine()
     try:
-        data.to_sql(table_name, engine, index=False, if_exists=mode, schema='dbo')
-        logger.info("Successfully inserted {} records to SQL Server table: {}".format(data.shape[0], table_name))
+        with sql_writers, engine.begin() as conn:
+            for data, table_name, keys, dtype in frames:
+                logger.info("Inserting records into the table: {}".format(table_name))
+                write_df_to_sql(data, table_name, mode, keys, conn, dtype)
     except Exception as e:
         logger.error("Exception raised while sending df to sql_server: {}, exiting".format(e))
         sys.exit(1)
 
 
+def get_load_table(table_name):
+    return "{}_load".format(table_name)
+
+
+def send_batch_to_load_table(data, table_name, first_batch, dtype=None):
+    # Streamed batches land in dbo.<table>_load, the target is only touched by finalise_load_table
+    load_table = get_load_table(table_name)
+    if_exists = "replace" if first_batch else "append"
+    data = get_sql_frame(data)
+    with sql_writers:
+        data.to_sql(load_table, get_engine(), index=False, if_exists=if_exists, schema='dbo', dtype=dtype)
+
+
+def finalise_load_table(table_name, mode="replace", keys=None, latest="lastupdatedtime"):
+    # latest: the column that orders the batches, a key streamed in more than one batch keeps its last row
+    load_table = get_load_table(table_name)
+    with sql_writers, get_engine().begin() as conn:
+        target_exists = conn.dialect.has_table(conn, table_name, schema='dbo')
+        if mode == "upsert":
+            # Batches are deduplicated on their own, a key can still arrive in two of them
+            # (the watermark overlap, $skip pages) and MERGE rejects a source matching a target row twice
+            conn.execute(get_dedup_statement(load_table, keys, latest))
+        if mode == "upsert" and target_exists:
+            columns = [column["name"] for column in inspect(conn).get_columns(load_table, schema='dbo')]
+            conn.execute(get_merge_statement(table_name, "dbo.[{}]".format(load_table), columns, keys))
+            conn.execute("DROP TABLE dbo.[{}]".format(load_table))
+        else:
+            # Swap the fully loaded table in, readers never see a half written target
+            if target_exists:
+                conn.execute("DROP TABLE dbo.[{}]".format(table_name))
+            conn.execute("EXEC sp_rename 'dbo.{}', '{}'".format(load_table, table_name))
+            if mode == "upsert":
+                create_key_index(table_name, keys, conn)
+    logger.info("Finalised load of table: {}, mode: {}".format(table_name, mode))
+
+
 def create_pd(recs, cols):
     try:
-        logger.info("Total records: {}".format(recs))
+        # Only the size, the records themselves would cost more to format than to load
+        logger.info("Total records: {}".format(len(recs)))
         df = pd.DataFrame(recs, columns=cols)
 
-        logger.info("Prepared DF: {}".format(df))
+        logger.info("Prepared DF: {} rows, {} columns".format(df.shape[0], df.shape[1]))
         return df
     except Exception as e:
         logger.error("Exception raised while preparing pandas df with "
-                     "records: {} and columns: {}, Message: {}".format(recs, cols, e))
+                     "{} records and columns: {}, Message: {}".format(len(recs), cols, e))
         return None
@@ -0,0 +1,78 @@
+import os
+import logging
+import datetime
+
+import pandas as pd
+
+from utils import get_engine
+
+logger = logging.getLogger('WATERMARKS')
+
+# INCREMENTAL=true only pulls rows changed since the last stored high-water mark
+INCREMENTAL = os.getenv("INCREMENTAL", "false").lower() == "true"
+# Re-read a window before the watermark so rows committed late on the SAP side are not missed
+WATERMARK_OVERLAP = datetime.timedelta(minutes=int(os.getenv("WATERMARK_OVERLAP_MINUTES", "60")))
+WATERMARK_TABLE = "macmahon_extraction_watermarks"
+
+
+def create_watermark_table(conn):
+    conn.execute("IF OBJECT_ID('dbo.{0}', 'U') IS NULL "
+                 "CREATE TABLE dbo.{0} (entity NVARCHAR(128) NOT NULL PRIMARY KEY, "
+                 "watermark DATETIME2 NOT NULL, updated_at DATETIME2 NOT NULL)".format(WATERMARK_TABLE))
+
+
+def get_watermark(entity):
+    engine = get_engine()
+    with engine.begin() as conn:
+        create_watermark_table(conn)
+        row = conn.execute("SELECT watermark FROM dbo.{} WHERE entity = ?".format(WATERMARK_TABLE), entity).fetchone()
+
+    if row is None:
+        return None
+
+    # Watermarks are stored as UTC
+    return pd.Timestamp(row[0], tz="UTC")
+
+
+def set_watermark(entity, watermark):
+    watermark_utc = watermark.tz_convert("UTC").tz_localize(None).to_pydatetime()
+    engine = get_engine()
+    with engine.begin() as conn:
+        create_watermark_table(conn)
+        conn.execute("UPDATE dbo.{} SET watermark = ?, updated_at = SYSUTCDATETIME() WHERE entity = ?"
+                     .format(WATERMARK_TABLE), watermark_utc, entity)
+        conn.execute("IF NOT EXISTS (SELECT 1 FROM dbo.{0} WHERE entity = ?) "
+                     "INSERT INTO dbo.{0} (entity, watermark, updated_at) VALUES (?, ?, SYSUTCDATETIME())"
+                     .format(WATERMARK_TABLE), entity, entity, watermark_utc)
+    logger.info("Stored watermark: {} for: {}".format(watermark, entity))
+
+
+def get_incremental_params(entity, column="LastChangeDateTime"):
+    if not INCREMENTAL:
+        return {}
+
+    watermark = get_watermark(entity)
+    if watermark is None:
+        logger.info("No watermark stored for: {}, running a full extraction".format(entity))
+        return {}
+
+    since = (watermark - WATERMARK_OVERLAP).strftime("%Y-%m-%dT%H:%M:%SZ")
+    logger.info("Extracting {} changed since: {} (watermark {})".format(entity, since, watermark))
+    return {"$filter": "{} gt datetimeoffset'{}'".format(column, since)}
+
+
+def get_max_watermark(data, column="LastChangeDateTime"):
+    changed = pd.to_datetime(data[column], errors="coerce", utc=True)
+    if changed.isnull().all():
+        return None
+
+    return changed.max()
+
+
+def update_watermark(entity, data, column="LastChangeDateTime"):
+    if data is None or data.empty:
+        return
+
+    watermark = get_max_watermark(data, column)
+    if watermark is not None:
+        set_watermark(entity, watermark)
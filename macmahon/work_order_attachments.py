@@ -1,9 +1,8 @@
 import os
-import sys
+import time
 import logging
-import requests
-from requests.auth import HTTPBasicAuth
-import xmltodict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 
@@ -12,26 +11,69 @@ from datetime import timedelta
 
 from utils import send_df_to_sql
 from utils import create_pd
+from utils import get_engine
+from sap_client import sap_get
+from sap_client import get_body_sample
+from sap_client import get_backoff
+from sap_client import RETRIES
+from odata import FEED_HEADERS
+from odata import read_entries
+from odata import read_body_entries
+from odata import batch_get
+from odata import READ_ERRORS
+from odata import get_response_bytes
+from entities import WORK_ORDER
+from extraction import to_datetimes
+from snapshots import iterate_snapshot
+from attachment_store import store_response
+from attachment_store import get_identity
+from attachment_store import get_stored
+from attachment_store import set_stored
+from checkpoints import get_resume_keys
+from checkpoints import set_key_done
+from checkpoints import clear_checkpoint
+from metrics import count
+from metrics import timer
 
 logging.basicConfig(level="INFO")
 logger = logging.getLogger('WORK_ORDER_ATTACHMENTS')
 
-DEFAULT_INT_VALUE = 0
-DEFAULT_STRING_VALUE = ''
-
-user = os.getenv("SAP_USER", "SAP_USERNAME")
-password = os.getenv("PASSWORD", "SAP_PASSWORD")
-
-records = []
-attachment_records = []
-wo_columns = ["ID"]
+# Only work orders changed in the last ATTACHMENT_WINDOW_DAYS drive the attachment lookups
+ATTACHMENT_WINDOW = timedelta(days=int(os.getenv("ATTACHMENT_WINDOW_DAYS", "14")))
+# Attachments downloaded at the same time, further bounded by SAP_MAX_REQUESTS_PER_HOST
+ATTACHMENT_CONCURRENCY = int(os.getenv("ATTACHMENT_CONCURRENCY", "8"))
+# Listing batches in flight, they run in their own pool so the downloads never queue behind them
+ATTACHMENT_LISTING_CONCURRENCY = int(os.getenv("ATTACHMENT_LISTING_CONCURRENCY", "2"))
+# GetAllOriginals calls packed into one $batch request (1 sends a plain GET per work order), parts that fail
+# are sent again in the next batch up to ATTACHMENT_BATCH_RETRIES times
+ATTACHMENT_BATCH_SIZE = int(os.getenv("ATTACHMENT_BATCH_SIZE", "50"))
+ATTACHMENT_BATCH_RETRIES = int(os.getenv("ATTACHMENT_BATCH_RETRIES", "2"))
+ATTACHMENT_CHECKPOINT = "WORK_ORDER_ATTACHMENTS"
+# Listings (GetAllOriginals) and binaries (AttachmentContentSet) are served from different hosts
+ATTACHMENT_SERVICE_URL = os.getenv("ATTACHMENT_SERVICE_URL",
+                                   "https://my301469.s4hana.ondemand.com/sap/opu/odata/sap/API_CV_ATTACHMENT_SRV")
+ATTACHMENT_CONTENT_URL = os.getenv("ATTACHMENT_CONTENT_URL",
+                                   "https://id.api.s4hana.ondemand.com/sap/opu/odata/sap/API_CV_ATTACHMENT_SRV")
+
+ATTACHMENT_COLUMNS = ["id", "DocumentInfoRecordDocType", "DocumentInfoRecordDocNumber", "DocumentInfoRecordDocPart",
+                      "DocumentInfoRecordDocVersion", "LogicalDocument", "ArchiveDocumentID", "LinkedSAPObjectKey",
+                      "BusinessObjectTypeName", "FileName", "MimeType", "content_hash", "content_size",
+                      "storage_path", "stored_size"]
 
 
 def download_attachment(DocumentInfoRecordDocType, DocumentInfoRecordDocNumber, DocumentInfoRecordDocPart,
                         DocumentInfoRecordDocVersion, LogicalDocument, ArchiveDocumentID, LinkedSAPObjectKey,
-                        BusinessObjectTypeName):
-    url = "https://id.api.s4hana.ondemand.com/sap/opu/odata/sap/" \
-          "API_CV_ATTACHMENT_SRV/AttachmentContentSet(" \
+                        BusinessObjectTypeName, MimeType=None, FileName=None):
+    # Known document versions are not transferred again
+    identity = get_identity(DocumentInfoRecordDocType, DocumentInfoRecordDocNumber, DocumentInfoRecordDocPart,
+                            DocumentInfoRecordDocVersion, ArchiveDocumentID)
+    stored = get_stored(identity)
+    if stored is not None:
+        logger.debug("Attachment: {} already stored as: {}".format(identity, stored[2]))
+        count(ATTACHMENT_CHECKPOINT, "reused")
+        return stored
+
+    url = "{}/AttachmentContentSet(" \
           "DocumentInfoRecordDocType='{}'" \
           ",DocumentInfoRecordDocNumber='{}'," \
           "DocumentInfoRecordDocPart='{}'," \
@@ -39,7 +81,8 @@ def download_attachment(DocumentInfoRecordDocType, DocumentInfoRecordDocNumber,
           "LogicalDocument='{}'," \
           "ArchiveDocumentID='{}'," \
           "LinkedSAPObjectKey='{}'," \
-          "BusinessObjectTypeName='{}')/$value".format(DocumentInfoRecordDocType,
+          "BusinessObjectTypeName='{}')/$value".format(ATTACHMENT_CONTENT_URL,
+                                                       DocumentInfoRecordDocType,
                                                        DocumentInfoRecordDocNumber,
                                                        DocumentInfoRecordDocPart,
                                                        DocumentInfoRecordDocVersion,
@@ -48,201 +91,272 @@ def download_attachment(DocumentInfoRecordDocType, DocumentInfoRecordDocNumber,
                                                        LinkedSAPObjectKey,
                                                        BusinessObjectTypeName
                                                        )
-    r = requests.get(url, stream=True, auth=HTTPBasicAuth(user, password))
-    logger.debug("Status Code: {}".format(r.status_code))
-    if r.status_code == 200:
-        return r.content
-
-    return None
+    for attempt in range(RETRIES + 1):
+        with timer(ATTACHMENT_CHECKPOINT, "download"):
+            r = sap_get(url, stream=True)
+            logger.debug("Status Code: {}".format(r.status_code))
+            if r.status_code != 200:
+                logger.error("Could not download attachment: {}, status code: {}".format(url, r.status_code))
+                r.close()
+                return None
+
+            # Written to the content store chunk by chunk, the binary is never held in memory whole.
+            # A body that breaks off leaves nothing in the store and is downloaded again
+            try:
+                stored = store_response(r, MimeType, FileName)
+                break
+            except READ_ERRORS as e:
+                error = e
+            finally:
+                # As received, like the feed pages, also for an attempt that broke off
+                count(ATTACHMENT_CHECKPOINT, "bytes", get_response_bytes(r))
+
+        if attempt == RETRIES:
+            logger.error("Could not download attachment: {}, message: {}".format(url, error))
+            return None
+        delay = get_backoff(attempt)
+        logger.warning("Could not download attachment: {}, message: {}, retrying in {:.1f}s".format(url, error, delay))
+        time.sleep(delay)
+
+    set_stored(identity, stored)
+    count(ATTACHMENT_CHECKPOINT, "downloads")
+    return stored
+
+
+def get_attachment_path(worker_order_number):
+    return "GetAllOriginals?LinkedSAPObjectKey='{}'&BusinessObjectTypeName='PMAUFK'".format(worker_order_number)
 
 
 def get_attachment_data(worker_order_number):
-    attachment_url = "https://my301469.s4hana.ondemand.com/sap/opu/odata/sap/" \
-                     "API_CV_ATTACHMENT_SRV/GetAllOriginals?LinkedSAPObjectKey='{}'" \
-                     "&BusinessObjectTypeName='PMAUFK'".format(worker_order_number)
-    params = {
-        "LinkedSAPObjectKey": '{}'.format(worker_order_number),
-        "BusinessObjectTypeName": 'PMAUFK'
-    }
+    attachment_url = "{}/{}".format(ATTACHMENT_SERVICE_URL, get_attachment_path(worker_order_number))
 
-    response = requests.get(attachment_url, auth=HTTPBasicAuth(user, password))
+    with timer(ATTACHMENT_CHECKPOINT, "fetch"):
+        response = sap_get(attachment_url, stream=True, headers=FEED_HEADERS)
+    response.raw.decode_content = True
 
     if response.status_code == 200:
-        logger.debug("Response content: {}".format(response.content))
         return response
     else:
         logger.error("Could not retrieve data for work order: {}, Status_code: {}, Message: {}".
-                     format(worker_order_number, response.status_code, response.content))
+                     format(worker_order_number, response.status_code, get_body_sample(response)))
 
     return response
 
 
-def get_work_order_data(skiptoken):
-    dt = datetime.datetime.now() - timedelta(days=14)
-    new_format = "%Y-%m-%dT%H:%M:%SZ"
-    new_dt = str(dt.strftime(new_format))
-
-    logger.info("Processing data from: {}, date: {}".format(skiptoken, new_dt))
-    work_order_url = os.getenv("WORK_ORDER_URL",
-                               "https://id.api.s4hana.ondemand.com/sap/opu/odata/"
-                               "sap/YY1_WORKORDER_CDS/YY1_WorkOrder/")
-
-    params = {
-        "$skiptoken": skiptoken,
-        "$filter": "LastChangeDateTime ge datetimeoffset'{}'".format(new_dt)
-    }
-
-    logger.debug("URL: {}, Username: {} , Password: {}".format(work_order_url, user, password))
+def list_batched_attachments(work_orders):
+    # Parts come back in request order, so each one is matched to its work order by position
+    listings = {}
+    pending = list(work_orders)
+    for attempt in range(ATTACHMENT_BATCH_RETRIES + 1):
+        if not pending:
+            break
+        if attempt:
+            logger.info("Retrying attachment listing of {} work orders, attempt: {}".format(len(pending), attempt))
+
+        try:
+            with timer(ATTACHMENT_CHECKPOINT, "fetch"):
+                parts = batch_get(ATTACHMENT_SERVICE_URL, [get_attachment_path(wo) for wo in pending], FEED_HEADERS)
+        except Exception as e:
+            logger.error("Batch listing of {} work orders failed, message: {}".format(len(pending), e))
+            parts = None
+        failed = []
+        for position, wo in enumerate(pending):
+            part = parts[position] if parts is not None else None
+            if part is None or part["status"] != 200:
+                if part is not None:
+                    logger.info("Listing of work order: {} failed in batch, status code: {}".format(wo,
+                                                                                               part["status"]))
+                failed.append(wo)
+                continue
+            try:
+                listings[wo] = read_body_entries(part["body"], part["headers"].get("Content-Type", ""),
+                                                 ATTACHMENT_SERVICE_URL + "/")
+            except Exception as e:
+                logger.info("Could not parse listing of work order: {}, message: {}".format(wo, e))
+                failed.append(wo)
+        pending = failed
+
+    for wo in pending:
+        logger.error("Could not retrieve data for work order: {}".format(wo))
+    return listings
+
+
+def list_attachments(work_orders):
+    # {work order: GetAllOriginals entries}
+    if ATTACHMENT_BATCH_SIZE > 1:
+        return list_batched_attachments(work_orders)
+
+    listings = {}
+    for wo in work_orders:
+        try:
+            resp = get_attachment_data(wo)
+            if resp.status_code == 200:
+                listings[wo] = read_entries(resp)
+            else:
+                logger.info("Could not retrieve data for wo: {}".format(wo))
+        except Exception as e:
+            logger.error("Could not retrieve data for work order: {}, message: {}".format(wo, e))
+    return listings
 
-    # Making a get request
-    response = requests.get(work_order_url, params=params, auth=HTTPBasicAuth(user, password))
-    response.raw.decode_content = True
 
-    if response.status_code != 200:
-        logger.error("Received status code: {}, Content {}".format(response.status_code, response.content))
-        return None
+def get_window_start():
+    return pd.Timestamp.utcnow() - ATTACHMENT_WINDOW
 
-    logger.info("Response status: {}".format(response.status_code))
-    logger.info("Response content: {}".format(response.content))
 
-    return response.content
+def get_loaded_work_orders(since):
+    # Work orders already loaded by work_order_get.py, no second scan of YY1_WorkOrder
+    engine = get_engine()
+    with engine.connect() as conn:
+        if not conn.dialect.has_table(conn, WORK_ORDER["table"], schema='dbo'):
+            logger.info("Table: {} not loaded yet".format(WORK_ORDER["table"]))
+            return []
+        # LastChangeDateTime is stored as UTC
+        rows = conn.execute("SELECT ID FROM dbo.[{}] WHERE LastChangeDateTime >= ?".format(WORK_ORDER["table"]),
+                            since.tz_localize(None).to_pydatetime()).fetchall()
 
+    return [row[0] for row in rows]
 
-def prepare_work_order_data(wo_response):
-    try:
-        json_data = xmltodict.parse(wo_response)
-        logger.info("Prepared JSON Content: {}".format(json_data))
-        logger.info("Total entries: {}".format(len(json_data['feed']['entry'])))
 
-        for e in json_data["feed"]["entry"]:
-            keys = e['content']['m:properties'].keys()
-            logger.debug("Keys: {}".format(keys))
-            ID = str(e['content']['m:properties']['d:ID'])[3:]
+def get_snapshot_work_orders(snapshot, since):
+    # Work orders of the WORK_ORDER extraction running in the same process, page by page while it streams
+    id_position = WORK_ORDER["columns"].index("ID")
+    changed_position = WORK_ORDER["columns"].index("LastChangeDateTime")
+    for rows in iterate_snapshot(snapshot):
+        changed = to_datetimes(pd.Series([row[changed_position] for row in rows], dtype=object), utc=True)
+        for row, is_recent in zip(rows, changed >= since):
+            if is_recent:
+                yield row[id_position]
 
-            record_tuple = (ID)
 
-            records.append(record_tuple)
+def iterate_work_orders(snapshot=None):
+    # The loaded table covers work orders an incremental run does not pull again, the snapshot the ones
+    # changed since the table was loaded
+    since = get_window_start()
+    logger.info("Processing work orders changed since: {}".format(since))
+    sources = [get_loaded_work_orders(since)]
+    if snapshot is not None:
+        sources.append(get_snapshot_work_orders(snapshot, since))
 
-    except Exception as e:
-        logger.error("Exception raised while preparing data: {}".format(e))
-        return None
+    seen = set()
+    for source in sources:
+        for wo in source:
+            if wo not in seen:
+                seen.add(wo)
+                yield wo
 
+    logger.info("Total work orders processed: {}".format(len(seen)))
 
-def get_attachment_records(attachment_record):
-    json_data = xmltodict.parse(attachment_record)
 
+def get_attachment_record(entry):
     try:
-        if "entry" in json_data['feed'].keys():
-            logger.info("Processing entries for type: {}".format(type(json_data['feed']['entry'])))
-            if type(json_data['feed']['entry']) is list:
-                for entry in json_data['feed']['entry']:
-                    id = entry["id"]
-                    DocumentInfoRecordDocType = entry["m:properties"]['d:DocumentInfoRecordDocType']
-                    DocumentInfoRecordDocNumber = entry["m:properties"]['d:DocumentInfoRecordDocNumber']
-                    DocumentInfoRecordDocPart = entry["m:properties"]['d:DocumentInfoRecordDocPart']
-                    DocumentInfoRecordDocVersion = entry["m:properties"]['d:DocumentInfoRecordDocVersion']
-                    LogicalDocument = entry["m:properties"]['d:LogicalDocument']
-                    ArchiveDocumentID = entry["m:properties"]['d:ArchiveDocumentID']
-                    LinkedSAPObjectKey = entry["m:properties"]['d:LinkedSAPObjectKey']
-                    BusinessObjectTypeName = entry["m:properties"]['d:BusinessObjectTypeName']
-                    attachment = download_attachment(DocumentInfoRecordDocType, DocumentInfoRecordDocNumber,
-                                                     DocumentInfoRecordDocPart, DocumentInfoRecordDocVersion,
-                                                     LogicalDocument, ArchiveDocumentID, LinkedSAPObjectKey,
-                                                     BusinessObjectTypeName)
-
-                    record = (id, DocumentInfoRecordDocType, DocumentInfoRecordDocNumber, DocumentInfoRecordDocPart,
-                              DocumentInfoRecordDocVersion, LogicalDocument, ArchiveDocumentID, LinkedSAPObjectKey,
-                              BusinessObjectTypeName, attachment)
-                    attachment_records.append(record)
-
-            else:
-                id = json_data["feed"]["entry"]["id"]
-                DocumentInfoRecordDocType = json_data["feed"]["entry"]["m:properties"]['d:DocumentInfoRecordDocType']
-                DocumentInfoRecordDocNumber = json_data["feed"]["entry"]["m:properties"]['d:DocumentInfoRecordDocNumber']
-                DocumentInfoRecordDocPart = json_data["feed"]["entry"]["m:properties"]['d:DocumentInfoRecordDocPart']
-                DocumentInfoRecordDocVersion = json_data["feed"]["entry"]["m:properties"]['d:DocumentInfoRecordDocVersion']
-                LogicalDocument = json_data["feed"]["entry"]["m:properties"]['d:LogicalDocument']
-                ArchiveDocumentID = json_data["feed"]["entry"]["m:properties"]['d:ArchiveDocumentID']
-                LinkedSAPObjectKey = json_data["feed"]["entry"]["m:properties"]['d:LinkedSAPObjectKey']
-                BusinessObjectTypeName = json_data["feed"]["entry"]["m:properties"]['d:BusinessObjectTypeName']
-                attachment = download_attachment(DocumentInfoRecordDocType, DocumentInfoRecordDocNumber,
-                                                 DocumentInfoRecordDocPart, DocumentInfoRecordDocVersion,
-                                                 LogicalDocument, ArchiveDocumentID, LinkedSAPObjectKey,
-                                                 BusinessObjectTypeName)
-                record = (id, DocumentInfoRecordDocType, DocumentInfoRecordDocNumber, DocumentInfoRecordDocPart,
-                          DocumentInfoRecordDocVersion, LogicalDocument, ArchiveDocumentID,
-                          LinkedSAPObjectKey, BusinessObjectTypeName, attachment)
-
-                attachment_records.append(record)
+        id = entry["__id"]
+        DocumentInfoRecordDocType = entry['DocumentInfoRecordDocType']
+        DocumentInfoRecordDocNumber = entry['DocumentInfoRecordDocNumber']
+        DocumentInfoRecordDocPart = entry['DocumentInfoRecordDocPart']
+        DocumentInfoRecordDocVersion = entry['DocumentInfoRecordDocVersion']
+        LogicalDocument = entry['LogicalDocument']
+        ArchiveDocumentID = entry['ArchiveDocumentID']
+        LinkedSAPObjectKey = entry['LinkedSAPObjectKey']
+        BusinessObjectTypeName = entry['BusinessObjectTypeName']
+        FileName = entry.get('FileName')
+        MimeType = entry.get('MimeType')
+        stored = download_attachment(
+            DocumentInfoRecordDocType, DocumentInfoRecordDocNumber, DocumentInfoRecordDocPart,
+            DocumentInfoRecordDocVersion, LogicalDocument, ArchiveDocumentID, LinkedSAPObjectKey,
+            BusinessObjectTypeName, MimeType, FileName)
+        # No row for an attachment whose content is not in the store
+        if stored is None:
+            return None
+        content_hash, content_size, storage_path, stored_size = stored
+
+        return (id, DocumentInfoRecordDocType, DocumentInfoRecordDocNumber, DocumentInfoRecordDocPart,
+                DocumentInfoRecordDocVersion, LogicalDocument, ArchiveDocumentID, LinkedSAPObjectKey,
+                BusinessObjectTypeName, FileName, MimeType, content_hash, content_size, storage_path, stored_size)
 
     except Exception as e:
-        logger.error(
-            "Exception raised while processing record: {}, message: {}".format(attachment_record, e))
+        logger.error("Exception raised while processing attachment: {}, message: {}".format(entry.get("__id"), e))
         return None
 
 
-def prepare_attachments_data(work_orders):
-    columns = ["id", "DocumentInfoRecordDocType", "DocumentInfoRecordDocNumber", "DocumentInfoRecordDocPart",
-               "DocumentInfoRecordDocVersion", "LogicalDocument", "ArchiveDocumentID", "LinkedSAPObjectKey",
-               "BusinessObjectTypeName", "attachment"]
+def iterate_chunks(work_orders, size):
+    chunk = []
     for wo in work_orders:
-        resp = get_attachment_data(wo)
-        if resp.status_code == 200:
-            get_attachment_records(resp.content)
+        chunk.append(wo)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def list_and_download(download_pool, work_orders):
+    # Runs in the listing pool, the downloads go to their own pool as soon as a listing is in.
+    # Returns [(work order, download futures)] of the work orders that could be listed
+    listings = list_attachments(work_orders)
+    logger.info("Processing {} attachment entries of {} work orders".format(
+        sum(len(entries) for entries in listings.values()), len(work_orders)))
+    return [(wo, [download_pool.submit(get_attachment_record, entry) for entry in listings[wo]])
+            for wo in work_orders if wo in listings]
+
+
+def collect_downloads(listing, attachment_records):
+    for wo, downloads in listing.result():
+        results = [download.result() for download in downloads]
+        records = [record for record in results if record is not None]
+        attachment_records.extend(records)
+        # A work order with a failed download is not done, a resumed run lists it again
+        # and only transfers what is not in the store yet
+        if len(records) < len(results):
+            logger.error("{} of {} attachments of work order: {} failed".format(len(results) - len(records),
+                                                                                  len(results), wo))
+            count(ATTACHMENT_CHECKPOINT, "failed_downloads", len(results) - len(records))
         else:
-            logger.info("Could not retrieve data for wo: {}".format(wo))
-
-    df = create_pd(attachment_records, columns)
-    df['lastupdatedtime'] = str(datetime.datetime.now())
-    return df
+            set_key_done(ATTACHMENT_CHECKPOINT, wo, records)
 
 
-def prepare_wo_data_and_pd():
-    next = True
-    skiptoken = 0
-    while next:
-        result = get_work_order_data(skiptoken)
-        prepare_work_order_data(result)
-        json = xmltodict.parse(result)
-        if "link" in json['feed'].keys():
-            if len(json['feed']['link']) == 2:
-                skiptoken = skiptoken + 1000
-            else:
-                next = False
-
-    if len(records) == 0:
-        return None
-    df = create_pd(records, wo_columns)
-    logger.info("Current time: {}".format(datetime.datetime.now()))
+def prepare_attachments_data(work_orders):
+    # Work orders are listed ATTACHMENT_BATCH_SIZE at a time and their attachments streamed to the content store
+    # by a bounded pool, only the metadata and storage references are collected.
+    # Each finished work order is checkpointed with its records, a resumed run only processes the rest
+    done = get_resume_keys(ATTACHMENT_CHECKPOINT)
+    attachment_records = [tuple(record) for records in done.values() for record in records]
+    work_orders = (wo for wo in work_orders if wo not in done)
+    with ThreadPoolExecutor(max_workers=max(ATTACHMENT_LISTING_CONCURRENCY, 1)) as listing_pool, \
+            ThreadPoolExecutor(max_workers=ATTACHMENT_CONCURRENCY) as download_pool:
+        # Listings are submitted a few at a time as the work orders come in, not all up front
+        listings = deque()
+        for chunk in iterate_chunks(work_orders, max(ATTACHMENT_BATCH_SIZE, 1)):
+            listings.append(listing_pool.submit(list_and_download, download_pool, chunk))
+            if len(listings) > ATTACHMENT_LISTING_CONCURRENCY:
+                collect_downloads(listings.popleft(), attachment_records)
+        while listings:
+            collect_downloads(listings.popleft(), attachment_records)
+
+    df = create_pd(attachment_records, ATTACHMENT_COLUMNS)
     df['lastupdatedtime'] = str(datetime.datetime.now())
-
     return df
 
 
-def prepare_wo_data_and_send_to_sql():
-    table_name = "macmahon_work_orders"
-    data = prepare_wo_data_and_pd()
-    logger.info("Sending WO data to SQL: {}".format(data))
-    if isinstance(data, pd.DataFrame):
-        send_df_to_sql(data, table_name)
-
-    return data
-
-
 def prepare_attachment_data_and_send_to_sql(work_order_numbers):
     table_name = "macmahon_work_order_attachments"
     df = prepare_attachments_data(work_order_numbers)
-    logger.info("Sending attachment data {} to SQL".format(df))
-    send_df_to_sql(df, table_name)
+    if df.shape[0] == 0:
+        logger.info("No attachments found, leaving table: {} untouched".format(table_name))
+        clear_checkpoint(ATTACHMENT_CHECKPOINT)
+        return None
+    logger.info("Sending {} attachment records to SQL".format(df.shape[0]))
+    count(ATTACHMENT_CHECKPOINT, "rows", df.shape[0])
+    with timer(ATTACHMENT_CHECKPOINT, "write"):
+        send_df_to_sql(df, table_name)
+    clear_checkpoint(ATTACHMENT_CHECKPOINT)
+    return df
+
+
+def prepare_recent_attachments_and_send_to_sql(snapshot=None):
+    # snapshot: snapshots.subscribe("WORK_ORDER") when the work orders are extracted in the same run
+    return prepare_attachment_data_and_send_to_sql(iterate_work_orders(snapshot))
 
 
 if __name__ == '__main__':
-    records_df = prepare_wo_data_and_pd()
-    if records_df is None:
-        logger.error("Error processing records, did not receive a dataframe output")
-        sys.exit(1)
-    wo_nums = records_df["ID"].tolist()
-    logger.info("Total work orders to process: {}".format(len(wo_nums)))
-    wo_nums = wo_nums[6600:]
-    logger.info("WorkOrders: {}".format(wo_nums))
-    prepare_attachment_data_and_send_to_sql(wo_nums)
+    # RESUME=true continues with the work orders a crashed run had not finished
+    prepare_recent_attachments_and_send_to_sql()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The extractors import each other as flat modules, and the tests never ask SAP for $metadata
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "macmahon"))
+os.environ.setdefault("USE_METADATA", "false")
@@ -0,0 +1,76 @@
+import io
+import os
+import hashlib
+
+import pytest
+import requests
+
+import metrics
+import attachment_store
+import work_order_attachments
+
+BODY = b"%PDF-1.4 " + b"x" * 5000
+DOCUMENT = ("DRW", "10000001", "000", "00", "LOGICAL", "ARCHIVE1", "4000001", "PMAUFK")
+
+
+class FakeDownload:
+    # A streamed $value response whose body breaks off after broken_at bytes
+    def __init__(self, body, broken_at=None):
+        self.status_code = 200
+        self.headers = {"Content-Type": "application/pdf"}
+        self.raw = io.BytesIO(body[:broken_at])
+        self.broken_at = broken_at
+
+    def iter_content(self, chunk_size=1):
+        for chunk in iter(lambda: self.raw.read(chunk_size), b""):
+            yield chunk
+        if self.broken_at is not None:
+            raise requests.exceptions.ChunkedEncodingError("Connection broken: IncompleteRead")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(attachment_store, "ATTACHMENT_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(attachment_store, "index", None)
+    monkeypatch.setattr(work_order_attachments, "get_backoff", lambda attempt: 0)
+    yield tmp_path
+    attachment_store.close_index()
+
+
+def get_stored_files(store):
+    return [name for _, _, names in os.walk(store) for name in names if name != attachment_store.INDEX_NAME]
+
+
+def get_counter(name):
+    return metrics.counters.get((work_order_attachments.ATTACHMENT_CHECKPOINT, name), 0)
+
+
+def test_a_download_that_breaks_off_is_downloaded_again(monkeypatch, store):
+    responses = [FakeDownload(BODY, broken_at=2000), FakeDownload(BODY)]
+    monkeypatch.setattr(work_order_attachments, "sap_get", lambda url, stream=False: responses.pop(0))
+    received = get_counter("bytes")
+
+    stored = work_order_attachments.download_attachment(*DOCUMENT, MimeType="application/pdf")
+
+    assert responses == []
+    assert stored[:2] == (hashlib.sha256(BODY).hexdigest(), len(BODY))
+    assert len(get_stored_files(store)) == 1
+    # Bytes as they came over the wire, the attempt that broke off included
+    assert get_counter("bytes") - received == 2000 + len(BODY)
+
+
+def test_a_download_that_keeps_breaking_off_stores_nothing(monkeypatch, store):
+    requested = []
+
+    def sap_get(url, stream=False):
+        requested.append(url)
+        return FakeDownload(BODY, broken_at=2000)
+
+    monkeypatch.setattr(work_order_attachments, "sap_get", sap_get)
+
+    assert work_order_attachments.download_attachment(*DOCUMENT, MimeType="application/pdf") is None
+    assert len(requested) == work_order_attachments.RETRIES + 1
+    assert get_stored_files(store) == []
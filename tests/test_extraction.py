@@ -0,0 +1,43 @@
+import io
+import decimal
+
+import pytest
+
+import extraction
+from odata import new_page
+from odata import iterate_atom_entries
+from odata import iterate_json_entries
+from synthetic_feeds import get_atom_page
+from synthetic_feeds import get_json_page
+
+ENTITY = {"name": "TEST_CONVERSIONS", "url": "https://sap/sap/opu/odata/sap/TEST_SRV/TestSet",
+          "columns": ["Amount", "Count", "IsDeleted"], "conversions": {}}
+FACETS = {"precision": "31", "scale": "14", "max_length": None}
+ROWS = [{"Amount": "12345678901234567.12345678901234", "Count": "7", "IsDeleted": "true"},
+        {"Amount": "", "Count": "x", "IsDeleted": "false"},
+        {"Amount": None, "Count": None, "IsDeleted": None}]
+
+
+@pytest.fixture(autouse=True)
+def column_types(monkeypatch):
+    monkeypatch.setitem(extraction.column_types, ENTITY["name"], {
+        "Amount": dict(FACETS, type="Edm.Decimal"),
+        "Count": dict(FACETS, type="Edm.Int32"),
+        "IsDeleted": dict(FACETS, type="Edm.Boolean"),
+    })
+
+
+@pytest.mark.parametrize("page_format", ["atom", "json"])
+def test_typed_columns_convert_the_same_from_both_formats(page_format):
+    if page_format == "atom":
+        entries = iterate_atom_entries(io.BytesIO(get_atom_page(ENTITY, ROWS)), new_page())
+    else:
+        entries = iterate_json_entries(io.BytesIO(get_json_page(ENTITY, ROWS)), '', new_page())
+    records = extraction.new_record_batch(ENTITY)
+    extraction.prepare_records(ENTITY, entries, records)
+    data = extraction.convert_columns(ENTITY, extraction.get_frame(records))
+
+    # Edm.Decimal keeps every digit, float64 would round it past 15-16 significant digits
+    assert data["Amount"].tolist() == [decimal.Decimal("12345678901234567.12345678901234"), None, None]
+    assert data["Count"].tolist()[0] == 7 and data["Count"].isnull().tolist() == [False, True, True]
+    assert data["IsDeleted"].tolist()[:2] == [True, False] and data["IsDeleted"].isnull().tolist()[2]
@@ -0,0 +1,198 @@
+import io
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+import pytest
+
+import odata
+import extraction
+from entities import ENTITIES
+from columnar import new_batch
+from columnar import append_rows
+from columnar import get_rows as get_batch_rows
+from columnar import truncate_batch
+from columnar import ENCODED
+from columnar import INT64
+from synthetic_feeds import get_rows
+from synthetic_feeds import get_atom_page
+
+ENTITY = ENTITIES["WORK_ORDER"]
+ROWS = 20
+URL = "https://sap/feed"
+
+
+class FakeResponse:
+    def __init__(self, body, url=URL, status_code=200):
+        self.raw = io.BytesIO(body)
+        self.status_code = status_code
+        self.headers = {"Content-Type": "application/atom+xml"}
+        self.url = url
+        self.content = body
+        self.text = body.decode()
+
+    def close(self):
+        pass
+
+
+def get_pages(count):
+    # Sequential pages chained by next links https://sap/page/1, /2, ...
+    pages = []
+    for number in range(count):
+        next_link = "https://sap/page/{}".format(number + 1) if number < count - 1 else None
+        rows = get_rows(ENTITY, ROWS, start=number * ROWS, seed=number)
+        pages.append(get_atom_page(ENTITY, rows, next_link=next_link))
+    return pages
+
+
+def get_page_number(link):
+    return 0 if link is None else int(link.rsplit("/", 1)[1])
+
+
+def get_skip_page(link):
+    # ($skip, $top) of a page of the $count plan, answered with $top rows
+    query = parse_qs(urlsplit(link).query)
+    skip, top = int(query["$skip"][0]), int(query["$top"][0])
+    return skip, top, FakeResponse(get_atom_page(ENTITY, get_rows(ENTITY, top, start=skip)))
+
+
+def count_as(monkeypatch, total):
+    status_code = 200 if total is not None else 500
+    monkeypatch.setattr(odata, "sap_get", lambda url, params=None: FakeResponse(str(total).encode(),
+                                                                                status_code=status_code))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(odata, "get_backoff", lambda attempt: 0)
+
+
+def test_a_page_that_breaks_off_is_read_again_and_its_rows_kept_once(monkeypatch):
+    pages = get_pages(3)
+    requests = []
+
+    def get_page(link):
+        number = get_page_number(link)
+        requests.append(number)
+        body = pages[number]
+        # The first answer for the second page breaks off half way through its entries
+        return FakeResponse(body[:len(body) // 2] if requests.count(number) == 1 and number == 1 else body)
+
+    monkeypatch.setattr(extraction, "get_page_getter", lambda entity, params: get_page)
+    records = extraction.new_record_batch(ENTITY)
+    for _ in extraction.iterate_record_pages(ENTITY, records):
+        pass
+
+    ids = [row[ENTITY["columns"].index("ID")] for row in get_batch_rows(records)]
+    assert requests == [0, 1, 1, 2]
+    assert len(ids) == 3 * ROWS
+    assert len(set(ids)) == 3 * ROWS
+
+
+def test_a_page_that_keeps_breaking_off_fails_with_its_number(monkeypatch):
+    pages = get_pages(2)
+    monkeypatch.setattr(odata, "RETRIES", 1)
+
+    def get_page(link):
+        body = pages[get_page_number(link)]
+        return FakeResponse(body if link is None else body[:100])
+
+    with pytest.raises(RuntimeError, match="Page: 2"):
+        list(odata.iterate_pages(get_page))
+
+
+def test_truncate_batch_drops_the_rows_after_the_given_count():
+    batch = new_batch(["id", "name"], [INT64, ENCODED])
+    append_rows(batch, [(1, "a"), (2, "b")])
+    append_rows(batch, [(3, "c"), (4, "a")])
+
+    truncate_batch(batch, 2)
+    append_rows(batch, [(5, "a")])
+
+    assert get_batch_rows(batch) == [(1, "a"), (2, "b"), (5, "a")]
+
+
+@pytest.mark.parametrize("concurrency", ["1", "4"])
+def test_a_run_resumed_from_a_next_link_continues_from_it(monkeypatch, concurrency):
+    monkeypatch.setenv("WORK_ORDER_CONCURRENCY", concurrency)
+    pages = get_pages(4)
+    requests = []
+
+    def get_page(link):
+        requests.append(link)
+        return FakeResponse(pages[get_page_number(link)])
+
+    progress = odata.new_progress({"paging": odata.LINK_PAGING, "next_link": "https://sap/page/2", "pages": 2})
+    consumed = list(odata.iterate_entity_pages(get_page, URL, entity="WORK_ORDER", progress=progress))
+
+    assert requests == ["https://sap/page/2", "https://sap/page/3"]
+    assert [len(records) for records in consumed] == [ROWS, ROWS]
+
+
+@pytest.mark.parametrize("concurrency", ["1", "4"])
+def test_a_run_resumed_from_a_skip_page_continues_the_same_plan(monkeypatch, concurrency):
+    # Whatever the concurrency and ODATA_PAGE_SIZE are now, the pages are those of the checkpointed plan
+    monkeypatch.setenv("WORK_ORDER_CONCURRENCY", concurrency)
+    count_as(monkeypatch, 50)
+    requests = []
+
+    def get_page(link):
+        skip, top, response = get_skip_page(link)
+        requests.append((skip, top))
+        return response
+
+    progress = odata.new_progress({"paging": odata.SKIP_PAGING, "next_link": None, "pages": 2, "page_size": 10})
+    consumed = list(odata.iterate_entity_pages(get_page, URL, entity="WORK_ORDER", page_size=1000,
+                                               progress=progress, order_by="ID"))
+
+    assert sorted(requests) == [(20, 10), (30, 10), (40, 10)]
+    assert [len(records) for records in consumed] == [10, 10, 10]
+
+
+def test_a_skip_checkpoint_that_cannot_be_counted_fails_rather_than_follow_next_links(monkeypatch):
+    count_as(monkeypatch, None)
+    requests = []
+    progress = odata.new_progress({"paging": odata.SKIP_PAGING, "next_link": None, "pages": 2, "page_size": 10})
+
+    with pytest.raises(RuntimeError, match="Could not count"):
+        list(odata.iterate_entity_pages(requests.append, URL, entity="WORK_ORDER", progress=progress))
+    assert requests == []
+
+
+def test_a_checkpoint_without_its_paging_is_not_resumed():
+    progress = odata.new_progress({"next_link": None, "pages": 2})
+
+    with pytest.raises(RuntimeError, match="run without --resume"):
+        odata.iterate_entity_pages(lambda link: None, URL, entity="WORK_ORDER", progress=progress)
+
+
+@pytest.mark.parametrize("concurrency, paging", [("1", odata.LINK_PAGING), ("2", odata.SKIP_PAGING)])
+def test_the_progress_records_how_the_pages_were_requested(monkeypatch, concurrency, paging):
+    monkeypatch.setenv("WORK_ORDER_CONCURRENCY", concurrency)
+    count_as(monkeypatch, 2 * ROWS)
+    pages = get_pages(2)
+
+    def get_page(link):
+        if link is not None and "$skip" in link:
+            return get_skip_page(link)[2]
+        return FakeResponse(pages[get_page_number(link)])
+
+    progress = odata.new_progress()
+    for _ in odata.iterate_entity_pages(get_page, URL, entity="WORK_ORDER", page_size=ROWS, progress=progress):
+        odata.complete_page(progress)
+
+    assert (progress["paging"], progress["pages"]) == (paging, 2)
+
+
+@pytest.mark.parametrize("with_next_link", [True, False])
+def test_a_skip_page_shorter_than_its_top_fails_the_entity(monkeypatch, with_next_link):
+    # A gateway whose server page size is 15 answers a $top of 20 with 15 rows, and a next link for the rest
+    monkeypatch.setenv("WORK_ORDER_CONCURRENCY", "2")
+    count_as(monkeypatch, 50)
+
+    def get_page(link):
+        skip, top, _ = get_skip_page(link)
+        next_link = "{}&$skiptoken={}".format(link, skip + 15) if with_next_link and top > 15 else None
+        return FakeResponse(get_atom_page(ENTITY, get_rows(ENTITY, min(top, 15), start=skip), next_link=next_link))
+
+    with pytest.raises(RuntimeError, match="Page: 1 returned 15 of 20 records"):
+        list(odata.iterate_entity_pages(get_page, URL, entity="WORK_ORDER", page_size=20))
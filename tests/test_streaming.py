@@ -0,0 +1,70 @@
+import pytest
+
+import streaming
+from odata import new_progress
+from odata import LINK_PAGING
+from columnar import new_batch
+from columnar import append_rows
+
+
+@pytest.fixture
+def load_table(monkeypatch):
+    # The batches sent to the load table, and for every stored checkpoint how many batches had landed by then
+    landed = []
+    stored = []
+    monkeypatch.setattr(streaming, "send_batch_to_load_table",
+                        lambda data, table_name, first_batch, dtype=None: landed.append(data.shape[0]))
+    monkeypatch.setattr(streaming, "set_checkpoint", lambda name, state: stored.append((len(landed), state)))
+    monkeypatch.setattr(streaming, "finalise_load_table", lambda table_name, mode, keys: None)
+    monkeypatch.setattr(streaming, "clear_checkpoint", lambda name: None)
+    return landed, stored
+
+
+def iterate_pages(progress, pages, crash=False):
+    # One batch of two rows per page, as extraction.iterate_record_pages hands them over
+    batch = new_batch(["ID"])
+    for page in range(1, pages + 1):
+        append_rows(batch, [(page * 10,), (page * 10 + 1,)])
+        progress.update({"pages": page, "paging": LINK_PAGING, "next_link": "https://sap/page/{}".format(page)})
+        yield batch
+    if crash:
+        raise RuntimeError("Page: {} could not be read".format(pages + 1))
+
+
+def test_every_landed_batch_is_checkpointed_as_soon_as_it_lands(load_table):
+    landed, stored = load_table
+    progress = new_progress()
+
+    streaming.stream_pages_to_sql(iterate_pages(progress, 3), "t", progress=progress, entity_name="WORK_ORDER")
+
+    assert landed == [2, 2, 2]
+    assert [(landed_then, state["batches"], state["pages"]) for landed_then, state in stored] == [
+        (1, 1, 1), (2, 2, 2), (3, 3, 3)]
+
+
+def test_the_last_landed_batch_is_checkpointed_when_the_next_page_fails(load_table):
+    # Nothing fetched after the batch decides whether it counts as landed, a resumed run must not send it again
+    landed, stored = load_table
+    progress = new_progress()
+
+    with pytest.raises(RuntimeError):
+        streaming.stream_pages_to_sql(iterate_pages(progress, 1, crash=True), "t", progress=progress,
+                                      entity_name="WORK_ORDER")
+
+    assert landed == [2]
+    assert [(state["batches"], state["next_link"]) for _, state in stored] == [(1, "https://sap/page/1")]
+
+
+def test_a_batch_that_fails_to_land_is_not_checkpointed(load_table, monkeypatch):
+    _, stored = load_table
+
+    def send_batch_to_load_table(data, table_name, first_batch, dtype=None):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(streaming, "send_batch_to_load_table", send_batch_to_load_table)
+    progress = new_progress()
+
+    with pytest.raises(SystemExit):
+        streaming.stream_pages_to_sql(iterate_pages(progress, 1), "t", progress=progress, entity_name="WORK_ORDER")
+
+    assert stored == []
@@ -0,0 +1,28 @@
+import pandas as pd
+
+from utils import get_key_types
+from utils import KEY_MAX_LENGTH
+from columnar import new_batch
+from columnar import append_rows
+from columnar import get_frame
+from columnar import ENCODED
+from columnar import INT64
+
+
+def test_string_keys_get_an_indexable_type_whatever_dtype_pandas_infers():
+    # get_frame infers object columns under pandas 2 and StringDtype columns under pandas 3
+    batch = new_batch(["ID", "Item", "Text"], [ENCODED, INT64, ENCODED])
+    append_rows(batch, [("4000001", 10, "a"), ("4000002", 20, None)])
+    data = get_frame(batch)
+
+    key_types = get_key_types(data, ["ID", "Item"], {"Text": "given"})
+
+    assert set(key_types) == {"ID", "Text"}
+    assert key_types["ID"].length == KEY_MAX_LENGTH
+    assert key_types["Text"] == "given"
+
+
+def test_keys_that_are_all_missing_are_typed_as_strings():
+    data = pd.DataFrame({"ID": pd.Series([None, None], dtype=object)})
+
+    assert list(get_key_types(data, ["ID"])) == ["ID"]